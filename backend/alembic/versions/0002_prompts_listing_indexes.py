@@ -0,0 +1,47 @@
+"""Index prompts for newest-first (keyset) listing
+
+Replaces the single-column user_id index with (user_id, created_at DESC, id DESC) and adds
+(created_at DESC, id DESC) for the global listing. On PostgreSQL the indexes are built
+CONCURRENTLY so existing tables stay writable while they build.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-14
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE/DROP INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_prompts_user_created", "prompts",
+            ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_prompts_created", "prompts",
+            [sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_prompts_user_id", table_name="prompts", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index("ix_prompts_user_id", "prompts", ["user_id"], postgresql_concurrently=True)
+        op.drop_index("ix_prompts_created", table_name="prompts", postgresql_concurrently=True)
+        op.drop_index("ix_prompts_user_created", table_name="prompts", postgresql_concurrently=True)
@@ -1,15 +1,21 @@
 import os
+import re
+import json
 import time
+import asyncio
 import logging
+from typing import AsyncIterator
 
-# --- Conditional import for 'openai' library ---
+from .llm_cache import LLMCache, cache_key
+
+# --- Conditional import for 'aiohttp' library ---
 try:
-    import openai
-    OPENAI_SDK_AVAILABLE = True
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
 except ImportError:
-    openai = None # Ensuring 'openai' is defined even if import fails
-    OPENAI_SDK_AVAILABLE = False
-# -----------------------------------------------
+    aiohttp = None # Ensuring 'aiohttp' is defined even if import fails
+    AIOHTTP_AVAILABLE = False
+# ------------------------------------------------
 
 logger = logging.getLogger(__name__)
 
@@ -20,34 +26,97 @@ USE_MOCK_AI = False
 
 # --- Ollama Configuration (loaded from environment variables) ---
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+# Native Ollama API root (no '/v1'); a trailing '/v1' from older OpenAI-compat configs is dropped
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/").removesuffix("/v1")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2:0.5b") 
 
-OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "ollama") # Placeholder
+OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "ollama") # Placeholder, only sent for proxies that expect it
 
+# How long Ollama keeps the model loaded after a request, so warm requests never pay load time
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
-ollama_client = None
-if OPENAI_SDK_AVAILABLE and not USE_MOCK_AI:
-    if not OLLAMA_BASE_URL or not OLLAMA_MODEL:
-        logger.error(
-            "Ollama configuration (OLLAMA_BASE_URL, OLLAMA_MODEL) is missing. "
-            "Ollama integration will not work."
-        )
-    else:
-        try:
-            ollama_client = openai.OpenAI(
-                base_url=OLLAMA_BASE_URL,
-                api_key=OLLAMA_API_KEY, 
-            )
-            logger.info(f"OpenAI client initialized for Ollama: base_url='{OLLAMA_BASE_URL}', model='{OLLAMA_MODEL}'")
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client for Ollama: {e}", exc_info=True)
-            ollama_client = None # Ensuring it's None if initialization fails
-elif not OPENAI_SDK_AVAILABLE and not USE_MOCK_AI:
+# --- Connection Pool Configuration (aiohttp session) ---
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "200"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+OLLAMA_REQUEST_TIMEOUT = float(os.getenv("OLLAMA_REQUEST_TIMEOUT", "60"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+
+# Ask for both styles in one chat completion (falls back to one call per style if the reply can't be parsed)
+USE_DUAL_STYLE_PROMPT = os.getenv("OLLAMA_DUAL_STYLE_PROMPT", "1") == "1"
+
+# Micro-batching: collect single-style requests arriving within a short window and send
+# them to Ollama as one numbered prompt. Off by default because it packs different users'
+# queries into the same prompt; enable with OLLAMA_MICROBATCH="1".
+USE_MICROBATCHING = os.getenv("OLLAMA_MICROBATCH", "0") == "1"
+OLLAMA_MICROBATCH_WINDOW_MS = float(os.getenv("OLLAMA_MICROBATCH_WINDOW_MS", "10"))
+OLLAMA_MICROBATCH_MAX = int(os.getenv("OLLAMA_MICROBATCH_MAX", "16"))
+
+CASUAL_STYLE_DESCRIPTION = "casual, friendly, and engaging"
+FORMAL_STYLE_DESCRIPTION = "strictly formal, professional, and highly articulate"
+
+# Cache of successful generations keyed on (model, style, query); None when disabled
+response_cache = LLMCache.from_env()
+
+
+if not AIOHTTP_AVAILABLE and not USE_MOCK_AI:
     logger.error(
-        "OpenAI SDK ('openai' library) not installed, but USE_MOCK_AI is False. "
-        "Ollama integration requires the 'openai' library. Please install it: pip install openai"
+        "'aiohttp' library not installed, but USE_MOCK_AI is False. "
+        "Ollama integration requires the 'aiohttp' library. Please install it: pip install aiohttp"
+    )
+
+# Shared aiohttp session used for all Ollama requests. It is opened/closed by the
+# FastAPI startup/shutdown hooks (a ClientSession must be created inside a running event loop).
+http_session = None
+
+# Exception types raised by the aiohttp transport (empty tuples match nothing)
+_OLLAMA_CONNECTION_ERRORS = (aiohttp.ClientConnectionError,) if AIOHTTP_AVAILABLE else ()
+_OLLAMA_API_ERRORS = (aiohttp.ClientResponseError,) if AIOHTTP_AVAILABLE else ()
+
+
+async def open_http_session() -> None:
+    """
+    Creates the shared aiohttp session for Ollama requests, if aiohttp is installed.
+    """
+    global http_session
+    if USE_MOCK_AI or not AIOHTTP_AVAILABLE or http_session is not None:
+        return
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=OLLAMA_MAX_CONNECTIONS,
+            keepalive_timeout=OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+        headers={"Authorization": f"Bearer {OLLAMA_API_KEY}"},
+        timeout=aiohttp.ClientTimeout(total=OLLAMA_REQUEST_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
     )
+    logger.info(f"aiohttp session opened for Ollama: base_url='{OLLAMA_BASE_URL}'")
+
+
+async def prewarm_connections() -> None:
+    """
+    Sends Ollama an empty chat for OLLAMA_MODEL, which loads the model into memory
+    (held for OLLAMA_KEEP_ALIVE) and leaves a keep-alive connection in the pool
+    before the first user request. Failures are logged, never raised.
+    """
+    if USE_MOCK_AI or http_session is None:
+        return
+    chat_url = f"{OLLAMA_BASE_URL}/api/chat"
+    try:
+        async with http_session.post(chat_url, json={"model": OLLAMA_MODEL, "messages": [], "keep_alive": OLLAMA_KEEP_ALIVE}) as resp:
+            await resp.read()
+        logger.info(f"Ollama model '{OLLAMA_MODEL}' and connection pool pre-warmed via {chat_url}")
+    except Exception as e:
+        logger.warning(f"Could not pre-warm Ollama connection ({chat_url}): {e}")
+
+
+async def close_http_session() -> None:
+    """
+    Closes the shared aiohttp session, if one was opened.
+    """
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+        logger.info("aiohttp session for Ollama closed.")
 
 # --- Mock AI Implementation ---
 def _query_hf_model_mock(payload_inputs: str, style: str) -> list[dict[str, str]]:
@@ -75,45 +144,298 @@ def _query_hf_model_mock(payload_inputs: str, style: str) -> list[dict[str, str]
     return [{"generated_text": response_text}]
 
 # --- Ollama Integration ---
-def _query_ollama_model(client: openai.OpenAI | None, model_name: str, query_text: str, style_description: str) -> str | None:
+async def _ollama_chat(session: "aiohttp.ClientSession", model_name: str, messages: list[dict], options: dict) -> str:
     """
-    Helper function to query an Ollama model using the OpenAI-compatible API.
+    POSTs a non-streaming chat request to Ollama's native /api/chat endpoint and
+    returns the message content. keep_alive keeps the model resident between calls.
     """
-    if client is None:
-        logger.error("Ollama client is not initialized. Cannot query Ollama model.")
-        return "Error: Ollama client not initialized." # Return error string
+    payload = {
+        "model": model_name,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": options,
+    }
+    async with session.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    return data["message"]["content"]
+
 
+async def _ollama_chat_stream(session: "aiohttp.ClientSession", model_name: str, messages: list[dict], options: dict) -> AsyncIterator[str]:
+    """
+    Streams a chat request from Ollama's native /api/chat endpoint, yielding content
+    pieces as they are generated (Ollama sends one JSON object per line).
+    """
+    payload = {
+        "model": model_name,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": options,
+    }
+    async with session.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.content:
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            content = chunk.get("message", {}).get("content")
+            if content:
+                yield content
+            if chunk.get("done"):
+                break
+
+
+def _build_style_messages(query_text: str, style_description: str) -> list[dict]:
+    """
+    Builds the chat messages that rephrase one query into one style.
+    """
     system_prompt = f"You are an AI assistant. Your task is to rephrase the user's input into a {style_description} tone. Provide only the rephrased text, without any preamble or conversational filler."
-    logger.debug(f"OLLAMA Query: Style='{style_description}', Model='{model_name}', Prompt='{system_prompt}', UserQuery='{query_text[:70]}...'")
+    logger.debug(f"OLLAMA Query: Style='{style_description}', Prompt='{system_prompt}', UserQuery='{query_text[:70]}...'")
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query_text}
+    ]
+
+# Sampling options for a single styled rephrasing
+_STYLE_OPTIONS = {"num_predict": 250, "temperature": 0.7}
+
+
+# --- Micro-batching of concurrent requests ---
+_BATCH_SEGMENT_PATTERN = re.compile(r"\[(\d+)\](.*?)(?=\[\d+\]|$)", re.DOTALL)
+
+class BatchedOllamaDispatcher:
+    """
+    Collects single-style requests that arrive within a short window and sends each
+    (model, style) group to Ollama as one numbered prompt ('[1] q1\n[2] q2 ...'), then
+    resolves every caller's future with its own segment of the reply.
+    Segments missing from the reply are re-requested individually.
+    """
+
+    def __init__(self, session: "aiohttp.ClientSession", window_seconds: float = 0.01, max_batch: int = 16):
+        self.session = session
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """
+        Starts the background batching loop on the running event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Cancels the batching loop and fails any requests still waiting in the queue.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+        while self._queue is not None and not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Ollama batch dispatcher stopped."))
+
+    async def submit(self, model_name: str, query_text: str, style_description: str) -> str:
+        """
+        Queues one styled rephrasing and waits for its share of the batched reply.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((model_name, style_description), query_text, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_seconds
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups: dict[tuple[str, str], list] = {}
+            for group_key, query_text, future in batch:
+                groups.setdefault(group_key, []).append((query_text, future))
+            for (model_name, style_description), items in groups.items():
+                task = loop.create_task(self._dispatch(model_name, style_description, items))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, model_name: str, style_description: str, items: list) -> None:
+        try:
+            if len(items) == 1:
+                results = [await _ollama_chat(self.session, model_name, _build_style_messages(items[0][0], style_description), _STYLE_OPTIONS)]
+            else:
+                results = await self._dispatch_batch(model_name, style_description, [query_text for query_text, _ in items])
+        except asyncio.CancelledError:
+            for _, future in items:
+                future.cancel()
+            raise
+        except Exception as e: # Each waiting caller handles the error like a direct call failure
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _dispatch_batch(self, model_name: str, style_description: str, queries: list[str]) -> list[str]:
+        numbered_inputs = "\n".join(f"[{i}] {query_text}" for i, query_text in enumerate(queries, start=1))
+        messages = [
+            {"role": "system", "content": (
+                f"Rephrase each numbered input in a {style_description} tone. "
+                "Answer every input, keeping its number in the form [n] <rephrased text>. No preamble."
+            )},
+            {"role": "user", "content": numbered_inputs}
+        ]
+        options = {**_STYLE_OPTIONS, "num_predict": _STYLE_OPTIONS["num_predict"] * len(queries)}
+        response_text = (await _ollama_chat(self.session, model_name, messages, options)) or ""
+        segments = {int(index): text.strip() for index, text in _BATCH_SEGMENT_PATTERN.findall(response_text)}
+        logger.info(f"Ollama batch ({style_description} for model {model_name}): {len(queries)} inputs, {len(segments)} segments parsed.")
+
+        results = []
+        for i, query_text in enumerate(queries, start=1):
+            if segments.get(i):
+                results.append(segments[i])
+            else: # Missing or empty segment: ask for this one on its own
+                results.append(await _ollama_chat(self.session, model_name, _build_style_messages(query_text, style_description), _STYLE_OPTIONS))
+        return results
+
+
+# Running dispatcher, or None when micro-batching is disabled
+ollama_dispatcher: BatchedOllamaDispatcher | None = None
+
+async def start_batch_dispatcher() -> None:
+    """
+    Starts the micro-batching dispatcher if OLLAMA_MICROBATCH is enabled.
+    """
+    global ollama_dispatcher
+    if USE_MOCK_AI or not USE_MICROBATCHING or ollama_dispatcher is not None or http_session is None:
+        return
+    ollama_dispatcher = BatchedOllamaDispatcher(
+        session=http_session,
+        window_seconds=OLLAMA_MICROBATCH_WINDOW_MS / 1000,
+        max_batch=OLLAMA_MICROBATCH_MAX,
+    )
+    ollama_dispatcher.start()
+    logger.info(f"Ollama micro-batching enabled: window={OLLAMA_MICROBATCH_WINDOW_MS}ms, max_batch={OLLAMA_MICROBATCH_MAX}")
+
+async def stop_batch_dispatcher() -> None:
+    """
+    Stops the micro-batching dispatcher, if it is running.
+    """
+    global ollama_dispatcher
+    if ollama_dispatcher is not None:
+        await ollama_dispatcher.stop()
+        ollama_dispatcher = None
+
+
+async def _query_ollama_model(session: "aiohttp.ClientSession | None", model_name: str, query_text: str, style_description: str) -> str | None:
+    """
+    Helper coroutine to query an Ollama model through its native chat API.
+    With micro-batching enabled the request goes through the batch dispatcher.
+    Successful responses are cached, so repeated queries skip the model call entirely.
+    """
+    key = cache_key(model_name, style_description, query_text)
+    if response_cache is not None and (cached_text := await response_cache.get(key)) is not None:
+        logger.info(f"Ollama ({style_description} for model {model_name}) served from cache.")
+        return cached_text
+
+    if session is None:
+        logger.error("Ollama client is not initialized. Cannot query Ollama model.")
+        return "Error: Ollama client not initialized." # Return error string
 
     try:
-        completion = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query_text}
-            ],
-            max_tokens=250,  
-            temperature=0.7  
-        )
-        response_text = completion.choices[0].message.content.strip()
+        if ollama_dispatcher is not None:
+            response_text = await ollama_dispatcher.submit(model_name, query_text, style_description)
+        else:
+            response_text = await _ollama_chat(session, model_name, _build_style_messages(query_text, style_description), _STYLE_OPTIONS)
+        response_text = response_text.strip()
         logger.info(f"Ollama ({style_description} for model {model_name}) generated: {response_text[:100]}...")
+        if response_cache is not None:
+            await response_cache.set(key, response_text)
         return response_text
-    except openai.APIConnectionError as e:
+    except _OLLAMA_CONNECTION_ERRORS as e:
         logger.error(f"Ollama API Connection Error ({style_description}, model {model_name}): {e}. Is Ollama running at {OLLAMA_BASE_URL}?", exc_info=True)
         return f"Error: Could not connect to Ollama at {OLLAMA_BASE_URL}."
-    except openai.APIError as e:
+    except _OLLAMA_API_ERRORS as e:
         logger.error(f"Ollama API Error ({style_description}, model {model_name}): {e}", exc_info=True)
-        return f"Error: Ollama API returned an error ({e.status_code})." 
+        return f"Error: Ollama API returned an error ({e.status})." 
     except Exception as e:
         logger.critical(f"Ollama Error: An unexpected error occurred ({style_description}, model {model_name}): {e}", exc_info=True)
         return "Error: An unexpected error occurred with the Ollama model."
 
 
-def generate_responses(query: str) -> tuple[str | None, str | None]:
+_DUAL_STYLE_PATTERN = re.compile(r"\[1\](.*?)\[2\](.*)", re.DOTALL)
+
+async def _query_ollama_dual_style(session: "aiohttp.ClientSession | None", model_name: str, query_text: str) -> tuple[str, str] | None:
+    """
+    Generates both styles in a single chat completion, so the shared user query is
+    prefilled once instead of twice. The model is asked for '[1] <casual>' and
+    '[2] <formal>' segments, which are split apart here.
+    Returns None if the call fails or the reply doesn't follow that layout.
+    """
+    casual_key = cache_key(model_name, CASUAL_STYLE_DESCRIPTION, query_text)
+    formal_key = cache_key(model_name, FORMAL_STYLE_DESCRIPTION, query_text)
+    if response_cache is not None:
+        cached_casual = await response_cache.get(casual_key)
+        cached_formal = await response_cache.get(formal_key)
+        if cached_casual is not None and cached_formal is not None:
+            logger.info(f"Ollama (dual style for model {model_name}) served from cache.")
+            return cached_casual, cached_formal
+
+    if session is None:
+        return None
+
+    system_prompt = (
+        "You will produce two rephrasings of the user's text. "
+        f"The first is {CASUAL_STYLE_DESCRIPTION}; the second is {FORMAL_STYLE_DESCRIPTION}. "
+        "Output exactly: [1] <casual version>\n[2] <formal version>. No preamble."
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query_text}
+    ]
+    try:
+        response_text = (await _ollama_chat(session, model_name, messages, {"num_predict": 500, "temperature": 0.7})) or ""
+    except Exception as e:
+        logger.warning(f"Ollama dual-style request failed (model {model_name}): {e}", exc_info=True)
+        return None
+
+    match = _DUAL_STYLE_PATTERN.search(response_text)
+    if not match or not match.group(1).strip() or not match.group(2).strip():
+        logger.warning(f"Ollama dual-style reply could not be parsed (model {model_name}): {response_text[:100]}...")
+        return None
+
+    casual_text, formal_text = match.group(1).strip(), match.group(2).strip()
+    logger.info(f"Ollama (dual style for model {model_name}) generated: {casual_text[:50]}... / {formal_text[:50]}...")
+    if response_cache is not None:
+        await response_cache.set(casual_key, casual_text)
+        await response_cache.set(formal_key, formal_text)
+    return casual_text, formal_text
+
+
+async def generate_responses(query: str) -> tuple[str | None, str | None]:
     """
     Generates a casual and a formal response for a given query.
-    
+    Ollama is first asked for both styles in one call; if that reply can't be parsed,
+    the two styles are requested separately and concurrently.
     """
     if not query:
         logger.warning("generate_responses called with empty query.")
@@ -133,31 +455,43 @@ def generate_responses(query: str) -> tuple[str | None, str | None]:
 
     else: # Real API Path (Ollama)
         logger.info(f"--- Attempting OLLAMA API Call (Model: {OLLAMA_MODEL}) ---")
-        if not OPENAI_SDK_AVAILABLE:
-            logger.error("Ollama (Real AI) Error: 'openai' SDK is not available.")
-            return "Error: OpenAI SDK missing for Ollama.", "Error: OpenAI SDK missing for Ollama."
-        if ollama_client is None:
-            logger.error("Ollama (Real AI) Error: Ollama client failed to initialize.")
+        if not AIOHTTP_AVAILABLE:
+            logger.error("Ollama (Real AI) Error: 'aiohttp' library is not available.")
+            return "Error: aiohttp missing for Ollama.", "Error: aiohttp missing for Ollama."
+        if http_session is None:
+            logger.error("Ollama (Real AI) Error: Ollama HTTP session is not open.")
             return "Error: Ollama client not ready.", "Error: Ollama client not ready."
 
-        # Casual Response - Ollama
-        casual_response_text = _query_ollama_model(
-            client=ollama_client,
-            model_name=OLLAMA_MODEL,
-            query_text=query,
-            style_description="casual, friendly, and engaging"
-        )
+        dual_style_result = None
+        # With micro-batching on, per-style requests are what get batched across users
+        if USE_DUAL_STYLE_PROMPT and ollama_dispatcher is None:
+            dual_style_result = await _query_ollama_dual_style(
+                session=http_session,
+                model_name=OLLAMA_MODEL,
+                query_text=query
+            )
+
+        if dual_style_result is not None:
+            casual_response_text, formal_response_text = dual_style_result
+        else:
+            # Casual and Formal Responses - Ollama (issued concurrently)
+            casual_response_text, formal_response_text = await asyncio.gather(
+                _query_ollama_model(
+                    session=http_session,
+                    model_name=OLLAMA_MODEL,
+                    query_text=query,
+                    style_description=CASUAL_STYLE_DESCRIPTION
+                ),
+                _query_ollama_model(
+                    session=http_session,
+                    model_name=OLLAMA_MODEL,
+                    query_text=query,
+                    style_description=FORMAL_STYLE_DESCRIPTION
+                ),
+            )
         if casual_response_text is None or "Error:" in casual_response_text : # Checks if helper returned an error string or None
             logger.error(f"Ollama casual response generation failed. Fallback or error: {casual_response_text}")
             # casual_response_text will retain the error message from _query_ollama_model
-
-        # Formal Response - Ollama
-        formal_response_text = _query_ollama_model(
-            client=ollama_client,
-            model_name=OLLAMA_MODEL,
-            query_text=query,
-            style_description="strictly formal, professional, and highly articulate"
-        )
         if formal_response_text is None or "Error:" in formal_response_text: # Checks if helper returned an error string or None
             logger.error(f"Ollama formal response generation failed. Fallback or error: {formal_response_text}")
             # formal_response_text will retain the error message from _query_ollama_model
@@ -168,7 +502,89 @@ def generate_responses(query: str) -> tuple[str | None, str | None]:
         formal_response_text if formal_response_text is not None else "Failed to generate formal response."
     )
 
+async def _stream_style(session: "aiohttp.ClientSession", model_name: str, query_text: str, style_description: str) -> AsyncIterator[str]:
+    """
+    Streams one styled rephrasing. Cache hits are replayed as a single piece;
+    completed streams are cached. Errors are yielded as an 'Error: ...' piece.
+    """
+    key = cache_key(model_name, style_description, query_text)
+    if response_cache is not None and (cached_text := await response_cache.get(key)) is not None:
+        yield cached_text
+        return
+
+    pieces = []
+    try:
+        async for piece in _ollama_chat_stream(session, model_name, _build_style_messages(query_text, style_description), _STYLE_OPTIONS):
+            pieces.append(piece)
+            yield piece
+    except _OLLAMA_CONNECTION_ERRORS as e:
+        logger.error(f"Ollama API Connection Error while streaming ({style_description}, model {model_name}): {e}", exc_info=True)
+        yield f"Error: Could not connect to Ollama at {OLLAMA_BASE_URL}."
+        return
+    except _OLLAMA_API_ERRORS as e:
+        logger.error(f"Ollama API Error while streaming ({style_description}, model {model_name}): {e}", exc_info=True)
+        yield f"Error: Ollama API returned an error ({e.status})."
+        return
+    except Exception as e:
+        logger.critical(f"Ollama Error: An unexpected error occurred while streaming ({style_description}, model {model_name}): {e}", exc_info=True)
+        yield "Error: An unexpected error occurred with the Ollama model."
+        return
+
+    if response_cache is not None and pieces:
+        await response_cache.set(key, "".join(pieces).strip())
+
+
+async def stream_responses(query: str) -> AsyncIterator[tuple[str, str]]:
+    """
+    Streams the casual and formal responses for a query concurrently, yielding
+    ('casual' | 'formal', piece) tuples in whatever order the pieces arrive.
+    """
+    if not query:
+        logger.warning("stream_responses called with empty query.")
+        yield "casual", "Query was empty."
+        yield "formal", "Query was empty."
+        return
+
+    if USE_MOCK_AI:
+        casual_text, formal_text = await generate_responses(query)
+        yield "casual", casual_text
+        yield "formal", formal_text
+        return
+
+    if not AIOHTTP_AVAILABLE or http_session is None:
+        logger.error("Ollama (Real AI) Error: Ollama HTTP session is not open; cannot stream.")
+        yield "casual", "Error: Ollama client not ready."
+        yield "formal", "Error: Ollama client not ready."
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+    _done = object()
+
+    async def _pump(style: str, style_description: str) -> None:
+        try:
+            async for piece in _stream_style(http_session, OLLAMA_MODEL, query, style_description):
+                await queue.put((style, piece))
+        finally:
+            await queue.put((style, _done))
+
+    tasks = [
+        asyncio.create_task(_pump("casual", CASUAL_STYLE_DESCRIPTION)),
+        asyncio.create_task(_pump("formal", FORMAL_STYLE_DESCRIPTION)),
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            style, piece = await queue.get()
+            if piece is _done:
+                remaining -= 1
+                continue
+            yield style, piece
+    finally:
+        for task in tasks: # Client went away mid-stream: stop generating
+            task.cancel()
+
 # --- Main execution block for direct testing of this file ---
+# Run as a module from backend/: python -m app.ai_core
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
     logger.info(f"Testing AI Core (USE_MOCK_AI is currently set to: {USE_MOCK_AI})")
@@ -180,11 +596,18 @@ if __name__ == "__main__":
         "Explain blockchain technology.",
     ]
 
-    for i, test_query in enumerate(queries_to_test):
-        print(f"\n--- Test Query #{i+1} ---")
-        casual, formal = generate_responses(test_query)
-        print(f"Query: {test_query}")
-        print("----- Casual Response -----")
-        print(casual)
-        print("\n----- Formal Response -----")
-        print(formal)
+    async def _run_test_queries():
+        await open_http_session()
+        try:
+            for i, test_query in enumerate(queries_to_test):
+                print(f"\n--- Test Query #{i+1} ---")
+                casual, formal = await generate_responses(test_query)
+                print(f"Query: {test_query}")
+                print("----- Casual Response -----")
+                print(casual)
+                print("\n----- Formal Response -----")
+                print(formal)
+        finally:
+            await close_http_session()
+
+    asyncio.run(_run_test_queries())
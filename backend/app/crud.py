@@ -1,75 +1,139 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, update, delete, tuple_, func
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List 
+from datetime import datetime
+import base64
 import uuid
 
 
 from . import database as db_module
 from . import schemas
 
-def get_interaction(db: Session, interaction_id: uuid.UUID) -> Optional[db_module.PromptInteraction]:
+async def get_interaction(db: AsyncSession, interaction_id: uuid.UUID) -> Optional[db_module.PromptInteraction]:
     """
     Retrieves a single prompt interaction by its ID.
     """
-    return db.query(db_module.PromptInteraction).filter(db_module.PromptInteraction.id == interaction_id).first()
+    stmt = select(db_module.PromptInteraction).where(db_module.PromptInteraction.id == interaction_id)
+    return (await db.execute(stmt)).scalar_one_or_none()
 
-def get_interactions(db: Session, skip: int = 0, limit: int = 100) -> List[db_module.PromptInteraction]:
+# Characters of each response included in list views; the full text is served by get_interaction
+LIST_PREVIEW_CHARS = 200
+
+def _list_item_columns():
+    """
+    Columns selected for list views: everything but the full response texts, which are
+    truncated in SQL so long generations aren't shipped from the database per row.
+    """
+    model = db_module.PromptInteraction
+    return (
+        model.id,
+        model.user_id,
+        model.query,
+        func.substr(model.casual_response, 1, LIST_PREVIEW_CHARS).label("casual_preview"),
+        func.substr(model.formal_response, 1, LIST_PREVIEW_CHARS).label("formal_preview"),
+        model.created_at,
+    )
+
+def encode_cursor(created_at: datetime, interaction_id: uuid.UUID) -> str:
+    """
+    Encodes the position of an interaction as an opaque keyset pagination cursor.
+    """
+    raw_cursor = f"{created_at.isoformat()}|{interaction_id}"
+    return base64.urlsafe_b64encode(raw_cursor.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """
+    Decodes a cursor produced by encode_cursor.
+    Raises ValueError if the cursor is malformed.
     """
-    Retrieves a list of prompt interactions, with pagination.
+    try:
+        created_at, interaction_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(interaction_id)
+    except ValueError as e: # Also covers binascii.Error and UnicodeDecodeError
+        raise ValueError(f"Invalid pagination cursor: {cursor!r}") from e
+
+def _newest_first_page(stmt, cursor: Optional[str], limit: int):
+    """
+    Applies keyset pagination to stmt: rows strictly after the cursor, newest first, with id as tie-breaker.
+    Each page is an index seek, so its cost doesn't grow with page depth the way OFFSET does.
+    """
+    model = db_module.PromptInteraction
+    if cursor is not None:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(model.created_at, model.id) < tuple_(cursor_created_at, cursor_id))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+
+async def get_interactions(db: AsyncSession, cursor: Optional[str] = None, limit: int = 100) -> List[Row]:
+    """
+    Retrieves a page of prompt interaction list items, starting after `cursor` (or from the newest).
     Orders by creation date descending (newest first).
     """
-    return db.query(db_module.PromptInteraction).order_by(db_module.PromptInteraction.created_at.desc()).offset(skip).limit(limit).all()
+    stmt = _newest_first_page(select(*_list_item_columns()), cursor, limit)
+    return list((await db.execute(stmt)).all())
 
-def get_interactions_by_user(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[db_module.PromptInteraction]:
+async def get_interactions_by_user(db: AsyncSession, user_id: str, cursor: Optional[str] = None, limit: int = 100) -> List[Row]:
     """
-    Retrieves a list of prompt interactions for a specific user, with pagination.
+    Retrieves a page of prompt interaction list items for a specific user, starting after `cursor`.
     Orders by creation date descending.
     """
-    return db.query(db_module.PromptInteraction).filter(db_module.PromptInteraction.user_id == user_id).order_by(db_module.PromptInteraction.created_at.desc()).offset(skip).limit(limit).all()
+    stmt = _newest_first_page(select(*_list_item_columns()).where(db_module.PromptInteraction.user_id == user_id), cursor, limit)
+    return list((await db.execute(stmt)).all())
 
-def create_interaction(db: Session, interaction: schemas.InteractionCreateInternal) -> db_module.PromptInteraction:
+async def create_interaction(db: AsyncSession, interaction: schemas.InteractionCreateInternal) -> db_module.PromptInteraction:
     """
     Creates a new prompt interaction in the database.
+    Issues a single INSERT ... RETURNING, so server-generated columns (created_at) come back
+    without a follow-up refresh SELECT.
     """
-    db_interaction_instance = db_module.PromptInteraction(
-        user_id=interaction.user_id,
-        query=interaction.query,
-        casual_response=interaction.casual_response,
-        formal_response=interaction.formal_response
-    )
-    db.add(db_interaction_instance)
-    db.commit()
-    db.refresh(db_interaction_instance)
+    # Pre-assigned id/created_at win; unset ones fall back to the column defaults
+    values = interaction.model_dump(exclude={"id", "created_at"})
+    if interaction.id is not None:
+        values["id"] = interaction.id
+    if interaction.created_at is not None:
+        values["created_at"] = interaction.created_at
+    stmt = insert(db_module.PromptInteraction).values(**values).returning(db_module.PromptInteraction)
+    db_interaction_instance = (await db.execute(stmt)).scalar_one()
+    await db.commit()
     return db_interaction_instance
 
-def update_interaction(
-    db: Session, 
+async def update_interaction(
+    db: AsyncSession, 
     interaction_id: uuid.UUID, 
     interaction_update: schemas.InteractionUpdate
 ) -> Optional[db_module.PromptInteraction]:
     """
     Updates an existing prompt interaction.
     Only fields present in interaction_update will be changed.
+    Issues a single UPDATE ... RETURNING, so there is no separate lookup round-trip.
     """
-    db_interaction = get_interaction(db, interaction_id=interaction_id)
-    if db_interaction:
-        # Get data from Pydantic model, excluding unset fields to only update provided values
-        update_data = interaction_update.model_dump(exclude_unset=True)
-        
-        
-        for key, value in update_data.items():
-            setattr(db_interaction, key, value)
-        
-        db.commit()
-        db.refresh(db_interaction)
+    # Only read the fields the client actually sent; avoids a full model_dump pass
+    fields_set = interaction_update.model_fields_set
+    if not fields_set: # Nothing to change
+        return await get_interaction(db, interaction_id=interaction_id)
+    update_data = {field: getattr(interaction_update, field) for field in fields_set}
+
+    stmt = (
+        update(db_module.PromptInteraction)
+        .where(db_module.PromptInteraction.id == interaction_id)
+        .values(**update_data)
+        .returning(db_module.PromptInteraction)
+    )
+    db_interaction = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
     return db_interaction
 
-def delete_interaction(db: Session, interaction_id: uuid.UUID) -> Optional[db_module.PromptInteraction]:
+async def delete_interaction(db: AsyncSession, interaction_id: uuid.UUID) -> Optional[db_module.PromptInteraction]:
     """
     Deletes a prompt interaction by its ID.
     Returns the deleted interaction object, or None if not found.
+    Issues a single DELETE ... RETURNING, so there is no separate lookup round-trip.
     """
-    db_interaction = get_interaction(db, interaction_id=interaction_id)
-    if db_interaction:
-        db.delete(db_interaction)
-        db.commit()
+    stmt = (
+        delete(db_module.PromptInteraction)
+        .where(db_module.PromptInteraction.id == interaction_id)
+        .returning(db_module.PromptInteraction)
+    )
+    db_interaction = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
     return db_interaction # Returns the object that was deleted (now detached from session) or None
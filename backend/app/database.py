@@ -1,6 +1,8 @@
 import os
-from sqlalchemy import create_engine, Column, String, Text, DateTime, func
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+from sqlalchemy import Column, String, Text, DateTime, Index, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID 
 import uuid as py_uuid # For generating UUIDs
 from dotenv import load_dotenv
@@ -16,36 +18,89 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not found in environment variables. Ensure it's in backend/.env")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create missing tables on app startup (local development). Deployments manage the schema
+# with Alembic ('alembic upgrade head', run once per deploy), not on every worker boot.
+AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES", "0") == "1"
+
+# Async drivers: the usual sync-style URLs from .env are mapped onto them
+_ASYNC_DRIVERS = {
+    "postgresql://": "postgresql+asyncpg://",
+    "postgresql+psycopg2://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+def to_async_url(url: str) -> str:
+    """
+    Rewrites a database URL to use an asyncio driver (asyncpg, aiosqlite).
+    URLs that already name a driver other than the ones above are left untouched.
+    """
+    for sync_prefix, async_prefix in _ASYNC_DRIVERS.items():
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+# --- Connection Pool Configuration (loaded from environment variables) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")) # Recycle before server/proxy idle timeouts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1" # Detect stale connections before handing them out
+DB_BEHIND_PGBOUNCER = os.getenv("DB_BEHIND_PGBOUNCER", "0") == "1" # Transaction pooling can't keep asyncpg's prepared statements
+
+def _engine_options(url: str) -> dict:
+    """
+    Builds create_async_engine keyword arguments for the configured database.
+    SQLite (used for local test runs) keeps SQLAlchemy's default pool.
+    """
+    if url.startswith("sqlite"):
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_use_lifo": True, # Reuse the most recent connections so idle extras can time out
+    }
+    if DB_BEHIND_PGBOUNCER:
+        options["connect_args"] = {"statement_cache_size": 0}
+    return options
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class PromptInteraction(Base):
     __tablename__ = "prompts"
 
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=py_uuid.uuid4)
-    user_id = Column(String(255), index=True, nullable=False) # Added length for String
+    user_id = Column(String(255), nullable=False) # Added length for String; indexed via ix_prompts_user_created
     query = Column(Text, nullable=False)
     casual_response = Column(Text)
     formal_response = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-def get_db():
-    db = SessionLocal()
-    try:
+    __table_args__ = (
+        # Serves "WHERE user_id = ? ORDER BY created_at DESC" as an in-order index range scan
+        # (id breaks ties in keyset pagination)
+        Index("ix_prompts_user_created", user_id, created_at.desc(), id.desc()),
+        # Same for the global newest-first listing
+        Index("ix_prompts_created", created_at.desc(), id.desc()),
+    )
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def create_db_tables(): 
-    Base.metadata.create_all(bind=engine)
+async def create_db_tables(): 
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     print("Database tables checked/created.")
 
 if __name__ == "__main__":
     print("Attempting to create database tables (if they don't exist)...")
     
     try:
-        create_db_tables()
+        asyncio.run(create_db_tables())
         print("Successfully connected and checked/created tables.")
         print(f"Connected to: {DATABASE_URL.split('@')[-1]}") 
     except Exception as e:
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import logging
+
+from cachetools import TTLCache
+
+# --- Conditional import for 'redis' library (optional shared cache tier) ---
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis_asyncio = None # Ensuring 'redis_asyncio' is defined even if import fails
+    REDIS_AVAILABLE = False
+# ---------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# --- Cache Configuration (loaded from environment variables) ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAXSIZE = int(os.getenv("LLM_CACHE_MAXSIZE", "10000"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL") # Optional, e.g. "redis://localhost:6379/0"
+
+
+def cache_key(model: str, style: str, query: str) -> str:
+    """
+    Builds a deterministic cache key for one styled generation.
+    """
+    raw_key = json.dumps({"model": model, "style": style, "query": query}, sort_keys=True)
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Exact-match cache for AI-generated responses.
+
+    Entries live in an in-process TTL/LRU cache. When a Redis URL is given,
+    Redis is used as a shared second tier so hits are visible across workers.
+    Redis failures are logged and treated as cache misses.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: int = 3600, redis_url: str | None = None):
+        self.ttl = ttl
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._redis = None
+        if redis_url:
+            if REDIS_AVAILABLE:
+                self._redis = redis_asyncio.from_url(redis_url, decode_responses=True)
+                logger.info("LLM cache: Redis tier enabled.")
+            else:
+                logger.error(
+                    "LLM_CACHE_REDIS_URL is set but the 'redis' library is not installed. "
+                    "Falling back to the in-memory cache only. Please install it: pip install redis"
+                )
+
+    @classmethod
+    def from_env(cls) -> "LLMCache | None":
+        """
+        Builds the cache from environment variables, or returns None if caching is disabled.
+        """
+        if not LLM_CACHE_ENABLED:
+            logger.info("LLM cache disabled (LLM_CACHE_ENABLED != '1').")
+            return None
+        return cls(maxsize=LLM_CACHE_MAXSIZE, ttl=LLM_CACHE_TTL_SECONDS, redis_url=LLM_CACHE_REDIS_URL)
+
+    async def get(self, key: str) -> str | None:
+        """
+        Returns the cached response for key, or None on a miss.
+        """
+        value = self._local.get(key)
+        if value is not None or self._redis is None:
+            return value
+        try:
+            value = await self._redis.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache: Redis GET failed, treating as a miss: {e}")
+            return None
+        if value is not None:
+            self._local[key] = value # Promote shared hits into the local tier
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        """
+        Stores a response under key in every available tier.
+        """
+        self._local[key] = value
+        if self._redis is not None:
+            try:
+                await self._redis.set(key, value, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"LLM cache: Redis SET failed: {e}")
+
+    def clear(self) -> None:
+        """
+        Drops all entries from the in-process tier.
+        """
+        self._local.clear()
+
+    async def close(self) -> None:
+        """
+        Closes the Redis connection pool, if one was created.
+        """
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
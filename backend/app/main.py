@@ -1,8 +1,11 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional 
+from fastapi import FastAPI, Depends, HTTPException, status, Query, BackgroundTasks, Header
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Callable, Optional 
+import json
 import uuid 
 import logging
+from datetime import datetime, timezone
 
 
 from . import crud, schemas, database, ai_core
@@ -18,30 +21,91 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Database Session Dependency ---
-def get_db_session():
+async def get_db_session():
     """
     Dependency to get a new database session for each request.
     Ensures the session is closed after the request is finished.
     """
-    db = database.SessionLocal()
-    try:
+    async with database.SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def get_user_id(
+    x_user_id: str = Header(..., min_length=1, max_length=255, description="Identifier of the calling user.")
+) -> str:
+    """
+    Dependency reading the caller's user ID from the `X-User-Id` header.
+    FastAPI caches dependency results per request, so it is resolved once however many dependants use it.
+    """
+    return x_user_id
+
+def get_db_session_factory() -> Callable[[], AsyncSession]:
+    """
+    Dependency returning the session factory for work that outlives the request,
+    such as background tasks (the request-scoped session is closed by then).
+    """
+    return database.SessionLocal
+
+async def _persist_interaction(session_factory: Callable[[], AsyncSession], interaction: schemas.InteractionCreateInternal) -> None:
+    """
+    Saves an interaction using a fresh session. Runs as a background task, so errors are logged, not raised.
+    """
+    try:
+        async with session_factory() as db:
+            db_interaction = await crud.create_interaction(db=db, interaction=interaction)
+            logger.info(f"Successfully created interaction ID: {db_interaction.id}")
+    except Exception as e:
+        logger.error(f"Error saving interaction to database in background task: {e}", exc_info=True)
+
+def _build_page(rows: list, limit: int) -> Response:
+    """
+    Builds a page response from up to `limit + 1` rows; the extra row only signals that another page exists.
+    Rows come straight from the database, so the models are built with `model_construct` (no re-validation)
+    and dumped to JSON bytes directly; returning a Response also skips FastAPI's response_model validation.
+    """
+    items = [schemas.InteractionListItem.model_construct(**row._mapping) for row in rows[:limit]]
+    next_cursor = crud.encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+    page = schemas.PaginatedInteractionResponse.model_construct(items=items, next_cursor=next_cursor)
+    return Response(content=page.model_dump_json(), media_type="application/json")
+
+def _sse_event(event: str, data: dict) -> str:
+    """
+    Formats one Server-Sent Event. Data is JSON-encoded so newlines in generated text survive.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # --- Application Lifecycle Events ---
 @app.on_event("startup")
 async def on_startup():
     """
     Actions to perform when the application starts up.
-    Currently, it attempts to create database tables.
+    Creates database tables if AUTO_CREATE_TABLES is enabled, opens the shared Ollama HTTP session,
+    pre-warms its connection pool and starts the optional micro-batch dispatcher.
     """
-    logger.info("Application startup: attempting to create DB tables if they don't exist.")
-    try:
-        database.create_db_tables()
-        logger.info("Database tables checked/created successfully on startup.")
-    except Exception as e:
-        logger.error(f"CRITICAL: Error creating database tables during startup: {e}", exc_info=True)
+    if database.AUTO_CREATE_TABLES:
+        logger.info("Application startup: attempting to create DB tables if they don't exist.")
+        try:
+            await database.create_db_tables()
+            logger.info("Database tables checked/created successfully on startup.")
+        except Exception as e:
+            logger.error(f"CRITICAL: Error creating database tables during startup: {e}", exc_info=True)
+    else:
+        logger.info("Application startup: skipping DB table creation (AUTO_CREATE_TABLES != '1'); schema is managed by Alembic.")
+    await ai_core.open_http_session()
+    await ai_core.prewarm_connections()
+    await ai_core.start_batch_dispatcher()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    Actions to perform when the application shuts down.
+    Stops the micro-batch dispatcher, closes the shared HTTP session used for
+    Ollama requests and the response cache, and disposes of the DB connection pool.
+    """
+    await ai_core.stop_batch_dispatcher()
+    await ai_core.close_http_session()
+    if ai_core.response_cache is not None:
+        await ai_core.response_cache.close()
+    await database.engine.dispose()
         
 
 # --- API Endpoints ---
@@ -62,17 +126,19 @@ async def root():
 )
 async def handle_generate_request(
     request: schemas.InteractionCreateRequest,
-    db: Session = Depends(get_db_session)
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(get_user_id),
+    session_factory: Callable[[], AsyncSession] = Depends(get_db_session_factory)
 ):
     """
-    - **request**: Contains `user_id` and `query`.
+    - **request**: Contains the `query`; the user comes from the `X-User-Id` header.
     - Generates AI responses.
-    - Creates and stores a new `PromptInteraction` record.
-    - Returns the created interaction.
+    - Returns the interaction immediately, with `id` and `created_at` assigned here.
+    - Stores the new `PromptInteraction` record in a background task after the response is sent.
     """
-    logger.info(f"POST /generate/ - User: '{request.user_id}', Query: '{request.query[:50]}...'")
+    logger.info(f"POST /generate/ - User: '{user_id}', Query: '{request.query[:50]}...'")
     try:
-        casual_resp, formal_resp = ai_core.generate_responses(request.query)
+        casual_resp, formal_resp = await ai_core.generate_responses(request.query)
         if casual_resp is None and formal_resp is None:
             logger.error("AI core failed to generate any response for query.")
             raise HTTPException(
@@ -88,42 +154,86 @@ async def handle_generate_request(
             detail=f"AI generation error: {str(e)}"
         )
 
+    # Optimistic id/timestamp so the response doesn't wait on the DB commit
     interaction_to_create = schemas.InteractionCreateInternal(
-        user_id=request.user_id,
+        id=uuid.uuid4(),
+        created_at=datetime.now(timezone.utc),
+        user_id=user_id,
         query=request.query,
         casual_response=casual_resp,
         formal_response=formal_resp
     )
-    
-    try:
-        db_interaction = crud.create_interaction(db=db, interaction=interaction_to_create)
-        logger.info(f"Successfully created interaction ID: {db_interaction.id}")
-        return db_interaction
-    except Exception as e:
-        logger.error(f"Error saving interaction to database: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error while saving interaction: {str(e)}"
-        )
+    background_tasks.add_task(_persist_interaction, session_factory, interaction_to_create)
+    return schemas.InteractionResponse(**interaction_to_create.model_dump())
+
+@app.post(
+    "/generate/stream",
+    summary="Stream Styled Responses",
+    description=(
+        "Streams casual and formal responses as Server-Sent Events while they are generated "
+        "('casual'/'formal' events carry text pieces, a final 'done' event carries the full texts). "
+        "The interaction is saved once the stream completes."
+    ),
+    response_class=StreamingResponse
+)
+async def handle_generate_stream_request(
+    request: schemas.InteractionCreateRequest,
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(get_user_id),
+    session_factory: Callable[[], AsyncSession] = Depends(get_db_session_factory)
+):
+    """
+    - **request**: Contains the `query`; the user comes from the `X-User-Id` header.
+    - Streams AI response pieces as they arrive (time-to-first-token instead of full generation time).
+    - Saves the assembled interaction in a background task after the stream ends.
+    """
+    logger.info(f"POST /generate/stream - User: '{user_id}', Query: '{request.query[:50]}...'")
+    collected: dict[str, list[str]] = {"casual": [], "formal": []}
+
+    async def event_stream() -> AsyncIterator[str]:
+        async for style, piece in ai_core.stream_responses(request.query):
+            collected[style].append(piece)
+            yield _sse_event(style, {"text": piece})
+        yield _sse_event("done", {
+            "casual_response": "".join(collected["casual"]).strip(),
+            "formal_response": "".join(collected["formal"]).strip(),
+        })
+
+    async def persist_streamed_interaction() -> None:
+        if not collected["casual"] and not collected["formal"]:
+            logger.warning("Stream ended without any generated text; interaction not saved.")
+            return
+        await _persist_interaction(session_factory, schemas.InteractionCreateInternal(
+            user_id=user_id,
+            query=request.query,
+            casual_response="".join(collected["casual"]).strip(),
+            formal_response="".join(collected["formal"]).strip()
+        ))
+
+    # Background tasks run after the streaming body has been fully sent
+    background_tasks.add_task(persist_streamed_interaction)
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @app.get(
     "/interactions/",
-    response_model=List[schemas.InteractionResponse], 
+    response_model=schemas.PaginatedInteractionResponse, 
     summary="List All Interactions",
-    description="Retrieves a list of all prompt interactions with pagination."
+    description="Retrieves a page of all prompt interactions (with response previews), newest first, using cursor pagination."
 )
 async def read_all_interactions(
-    skip: int = Query(0, ge=0, description="Number of items to skip"),
+    cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page; omit for the first page"),
     limit: int = Query(10, ge=1, le=100, description="Maximum number of items to return"),
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session)
 ):
     """
-    Retrieves a paginated list of all interactions.
+    Retrieves a page of all interactions.
     """
-    logger.info(f"GET /interactions/ - Skip: {skip}, Limit: {limit}")
+    logger.info(f"GET /interactions/ - Cursor: {cursor}, Limit: {limit}")
     try:
-        interactions = crud.get_interactions(db, skip=skip, limit=limit)
-        return interactions
+        interactions = await crud.get_interactions(db, cursor=cursor, limit=limit + 1)
+        return _build_page(interactions, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching all interactions: {e}", exc_info=True)
         raise HTTPException(
@@ -133,26 +243,28 @@ async def read_all_interactions(
 
 @app.get(
     "/interactions/user/{user_id}",
-    response_model=List[schemas.InteractionResponse],
+    response_model=schemas.PaginatedInteractionResponse,
     summary="List Interactions by User ID",
-    description="Retrieves a list of prompt interactions for a specific user with pagination."
+    description="Retrieves a page of prompt interactions (with response previews) for a specific user, newest first, using cursor pagination."
 )
 async def read_interactions_for_user(
     user_id: str,
-    skip: int = Query(0, ge=0, description="Number of items to skip"),
+    cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page; omit for the first page"),
     limit: int = Query(10, ge=1, le=100, description="Maximum number of items to return"),
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session)
 ):
     """
-    Retrieves a paginated list of interactions for a given `user_id`.
+    Retrieves a page of interactions for a given `user_id`.
     """
-    logger.info(f"GET /interactions/user/{user_id} - Skip: {skip}, Limit: {limit}")
+    logger.info(f"GET /interactions/user/{user_id} - Cursor: {cursor}, Limit: {limit}")
     try:
-        interactions = crud.get_interactions_by_user(db, user_id=user_id, skip=skip, limit=limit)
+        interactions = await crud.get_interactions_by_user(db, user_id=user_id, cursor=cursor, limit=limit + 1)
         if not interactions:
             logger.info(f"No interactions found for user_id: {user_id}")
             
-        return interactions
+        return _build_page(interactions, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching interactions for user {user_id}: {e}", exc_info=True)
         raise HTTPException(
@@ -169,14 +281,14 @@ async def read_interactions_for_user(
 )
 async def read_single_interaction(
     interaction_id: uuid.UUID, 
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session)
 ):
     """
     Retrieves a specific interaction by its `interaction_id`.
     Returns 404 if not found.
     """
     logger.info(f"GET /interactions/{interaction_id}")
-    db_interaction = crud.get_interaction(db, interaction_id=interaction_id)
+    db_interaction = await crud.get_interaction(db, interaction_id=interaction_id)
     if db_interaction is None:
         logger.warning(f"Interaction with ID {interaction_id} not found.")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Interaction not found")
@@ -191,15 +303,15 @@ async def read_single_interaction(
 async def update_existing_interaction(
     interaction_id: uuid.UUID,
     interaction_update: schemas.InteractionUpdate,
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session)
 ):
     """
     Updates an interaction specified by `interaction_id`.
     - **interaction_update**: Pydantic model containing fields to update.
     Returns the updated interaction or 404 if not found.
     """
-    logger.info(f"PUT /interactions/{interaction_id} - Data: {interaction_update.model_dump(exclude_unset=True)}")
-    db_interaction = crud.update_interaction(db, interaction_id=interaction_id, interaction_update=interaction_update)
+    logger.info(f"PUT /interactions/{interaction_id} - Fields: {sorted(interaction_update.model_fields_set)}")
+    db_interaction = await crud.update_interaction(db, interaction_id=interaction_id, interaction_update=interaction_update)
     if db_interaction is None:
         logger.warning(f"Attempted to update non-existent interaction ID: {interaction_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Interaction not found for update")
@@ -214,14 +326,14 @@ async def update_existing_interaction(
 )
 async def delete_existing_interaction(
     interaction_id: uuid.UUID,
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session)
 ):
     """
     Deletes an interaction specified by `interaction_id`.
     Returns 204 No Content on success, or 404 if not found.
     """
     logger.info(f"DELETE /interactions/{interaction_id}")
-    db_interaction = crud.delete_interaction(db, interaction_id=interaction_id)
+    db_interaction = await crud.delete_interaction(db, interaction_id=interaction_id)
     if db_interaction is None: 
         logger.warning(f"Attempted to delete non-existent interaction ID: {interaction_id}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Interaction not found for deletion")
@@ -19,9 +19,8 @@ class InteractionBase(BaseModel):
 class InteractionCreateRequest(BaseModel):
     """
     Schema for the request body when creating a new prompt interaction.
-    The user_id can be provided, or a default can be used.
+    The user is identified by the `X-User-Id` header, not the body.
     """
-    user_id: str = Field(default="default_user", description="User ID, defaults to 'default_user'.")
     query: str = Field(..., min_length=1, description="The user's query or input text.")
 
 class InteractionUpdate(BaseModel):
@@ -47,9 +46,11 @@ class InteractionUpdate(BaseModel):
 class InteractionCreateInternal(InteractionBase):
     """
     Schema used internally by CRUD functions to create an interaction in the database.
-    Inherits all fields from InteractionBase.
+    Inherits all fields from InteractionBase. `id` and `created_at` may be pre-assigned
+    by the caller; when left unset the database defaults are used.
     """
-    pass 
+    id: Optional[uuid.UUID] = Field(None, description="Pre-assigned interaction ID.")
+    created_at: Optional[datetime] = Field(None, description="Pre-assigned creation timestamp.")
 
 
 # --- Schemas for API Responses ---
@@ -63,22 +64,33 @@ class InteractionResponse(InteractionBase):
     created_at: datetime = Field(..., description="Timestamp of when the interaction was created.")
 
     
-    model_config = ConfigDict(
-        from_attributes=True,  
-        json_encoders={       
-            datetime: lambda dt: dt.isoformat()
-        }
-    )
+    # No json_encoders: pydantic-core serializes UUID/datetime (ISO 8601) natively, which keeps
+    # FastAPI's direct-to-JSON-bytes response path free of per-value Python callbacks.
+    model_config = ConfigDict(from_attributes=True)
     
 
 
+class InteractionListItem(BaseModel):
+    """
+    Schema for an interaction in list responses.
+    Carries truncated previews of the responses; fetch the interaction by ID for the full texts.
+    """
+    id: uuid.UUID = Field(..., description="Unique identifier for the prompt interaction.")
+    user_id: str = Field(..., description="Identifier for the user who made the query.")
+    query: str = Field(..., description="The user's query or input text.")
+    casual_preview: Optional[str] = Field(None, description="Beginning of the AI-generated casual response.")
+    formal_preview: Optional[str] = Field(None, description="Beginning of the AI-generated formal response.")
+    created_at: datetime = Field(..., description="Timestamp of when the interaction was created.")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class PaginatedInteractionResponse(BaseModel):
     """
-    Schema for a paginated list of interactions.
+    Schema for one page of interactions (newest first).
+    Pass `next_cursor` back as the `cursor` query parameter to fetch the following page.
     """
-    total: int
-    skip: int
-    limit: int
-    items: List[InteractionResponse]
+    items: List[InteractionListItem]
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page; null on the last page.")
 
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
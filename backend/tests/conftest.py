@@ -2,3 +2,10 @@ import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """Runs async tests on asyncio only (the backend targets asyncio/uvicorn)."""
+    return "asyncio"
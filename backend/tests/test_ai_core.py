@@ -1,5 +1,6 @@
 import pytest
-import os
+import asyncio
+import types
 from unittest import mock # For mock.Mock if needed directly
 
 
@@ -16,130 +17,381 @@ def mock_ai_env_toggle(monkeypatch):
     yield _set_mock_ai
     monkeypatch.setattr(ai_core, "USE_MOCK_AI", original_use_mock_ai) # Restore
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Ensures cached generations from one test never leak into another."""
+    if ai_core.response_cache is not None:
+        ai_core.response_cache.clear()
+    yield
+    if ai_core.response_cache is not None:
+        ai_core.response_cache.clear()
+
 # --- Tests for MOCKED AI Path (USE_MOCK_AI = True) ---
 
-def test_generate_responses_mock_specific_queries(mock_ai_env_toggle):
+# (query, expected casual keyword, expected formal summary keyword) for the canned mock answers
+_MOCK_QUERY_CASES = (
+    ("python 2 and python 3", "Python 3 is like the cool", "python 2 is eol"),
+    ("climate change", "Earth getting a bit of a fever", "mitigation and adaptation are crucial"),
+    ("blockchain", "super secure digital notebook", "supply chain tracking"),
+)
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("query,casual_kw,formal_kw", _MOCK_QUERY_CASES, ids=[case[0] for case in _MOCK_QUERY_CASES])
+async def test_generate_responses_mock_specific_queries(mock_ai_env_toggle, query, casual_kw, formal_kw):
     mock_ai_env_toggle(True)
-    queries_and_expected_keywords = {
-        "python 2 and python 3": {
-            "casual": "Python 3 is like the cool", "formal_summary_keyword": "python 2 is eol"
-        },
-        "climate change": {
-            "casual": "Earth getting a bit of a fever", "formal_summary_keyword": "mitigation and adaptation are crucial"
-        },
-        "blockchain": {
-            "casual": "super secure digital notebook", "formal_summary_keyword": "supply chain tracking"
-        },
-    }
-    for query, details in queries_and_expected_keywords.items():
-        casual_resp, formal_resp = ai_core.generate_responses(query)
-        assert details["casual"].lower() in casual_resp.lower(), f"Casual response for '{query}' mismatch"
-        assert details["formal_summary_keyword"].lower() in formal_resp.lower(), \
-               f"Formal summarized response for '{query}' mismatch. Got: '{formal_resp}'"
+    casual_resp, formal_resp = await ai_core.generate_responses(query)
+    assert casual_kw.lower() in casual_resp.lower(), f"Casual response for '{query}' mismatch"
+    assert formal_kw.lower() in formal_resp.lower(), \
+           f"Formal summarized response for '{query}' mismatch. Got: '{formal_resp}'"
 
-def test_generate_responses_mock_generic_query(mock_ai_env_toggle):
+@pytest.mark.anyio
+async def test_generate_responses_mock_generic_query(mock_ai_env_toggle):
     mock_ai_env_toggle(True)
     query = "Tell me about ancient philosophy."
-    casual_resp, formal_resp = ai_core.generate_responses(query)
+    casual_resp, formal_resp = await ai_core.generate_responses(query)
     assert "mocked casual response" in casual_resp.lower()
     assert "mocked summary" in formal_resp.lower()
 
-def test_generate_responses_mock_formal_chaining_logic(mock_ai_env_toggle, mocker):
+@pytest.mark.anyio
+async def test_generate_responses_mock_formal_chaining_logic(mock_ai_env_toggle, monkeypatch):
     mock_ai_env_toggle(True)
     query = "A unique test query for chaining."
-    spy_mock_call = mocker.spy(ai_core, "_query_hf_model_mock")
-    ai_core.generate_responses(query) 
-    assert spy_mock_call.call_count >= 3
-    call_args_list = spy_mock_call.call_args_list
-    casual_call = next(c for c in call_args_list if c.args[1] == "casual")
-    assert casual_call.args[0] == query
-    formal_generate_call = next(c for c in call_args_list if c.args[1] == "formal_generate")
-    assert formal_generate_call.args[0] == query
-    formal_summarize_call = next(c for c in call_args_list if c.args[1] == "formal_summarize")
-    assert formal_summarize_call.args[0] != query
-    assert "initial mocked formal generation" in formal_summarize_call.args[0].lower()
+    # A plain recording wrapper instead of mocker.spy: only the call arguments are checked
+    calls = []
+    original_mock_call = ai_core._query_hf_model_mock
+    def _tap(payload_inputs, style):
+        calls.append((payload_inputs, style))
+        return original_mock_call(payload_inputs, style)
+    monkeypatch.setattr(ai_core, "_query_hf_model_mock", _tap)
+    await ai_core.generate_responses(query) 
+    assert len(calls) >= 3
+    casual_call = next(c for c in calls if c[1] == "casual")
+    assert casual_call[0] == query
+    formal_generate_call = next(c for c in calls if c[1] == "formal_generate")
+    assert formal_generate_call[0] == query
+    formal_summarize_call = next(c for c in calls if c[1] == "formal_summarize")
+    assert formal_summarize_call[0] != query
+    assert "initial mocked formal generation" in formal_summarize_call[0].lower()
 
 def test_mock_query_hf_model_mock_unknown_style(mock_ai_env_toggle):
     mock_ai_env_toggle(True)
     response = ai_core._query_hf_model_mock("test query", "unknown_style")
     assert "error: mock ai could not determine" in response[0]["generated_text"].lower()
 
+# --- Tests for OLLAMA Path (USE_MOCK_AI = False) ---
+
+@pytest.mark.anyio
+async def test_generate_responses_ollama_styles_run_concurrently(mock_ai_env_toggle, monkeypatch):
+    mock_ai_env_toggle(False)
+    monkeypatch.setattr(ai_core, "http_session", mock.Mock())
+    started_styles = []
+    both_started = asyncio.Event()
+
+    async def _fake_query(session, model_name, query_text, style_description):
+        started_styles.append(style_description)
+        if len(started_styles) == 2:
+            both_started.set()
+        # Only completes if the other style's call is in flight at the same time
+        await asyncio.wait_for(both_started.wait(), timeout=1)
+        return f"{style_description.split(',')[0]} reply"
+
+    monkeypatch.setattr(ai_core, "_query_ollama_model", _fake_query)
+    # Dual-style reply unusable, so both styles are requested separately
+    monkeypatch.setattr(ai_core, "_query_ollama_dual_style", mock.AsyncMock(return_value=None))
+    casual_resp, formal_resp = await ai_core.generate_responses("Concurrent query")
+    assert len(started_styles) == 2
+    assert casual_resp == "casual reply"
+    assert formal_resp == "strictly formal reply"
+
+@pytest.mark.anyio
+async def test_generate_responses_ollama_session_not_open(mock_ai_env_toggle, monkeypatch):
+    mock_ai_env_toggle(False)
+    monkeypatch.setattr(ai_core, "http_session", None)
+    casual_resp, formal_resp = await ai_core.generate_responses("A query")
+    assert "error: ollama client not ready" in casual_resp.lower()
+    assert "error: ollama client not ready" in formal_resp.lower()
+
+class _FakeAiohttpResponse:
+    def __init__(self, payload):
+        self._payload = payload
+        self.raise_for_status = mock.Mock()
+
+    async def json(self):
+        return self._payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+@pytest.mark.anyio
+async def test_ollama_chat_posts_to_native_api_with_keep_alive():
+    fake_session = mock.Mock()
+    fake_response = _FakeAiohttpResponse({"message": {"role": "assistant", "content": "Direct reply"}})
+    fake_session.post.return_value = fake_response
+    messages = [{"role": "user", "content": "Hi"}]
+
+    result = await ai_core._ollama_chat(fake_session, "test-model", messages, {"num_predict": 250})
+    assert result == "Direct reply"
+    fake_session.post.assert_called_once_with(f"{ai_core.OLLAMA_BASE_URL}/api/chat", json={
+        "model": "test-model",
+        "messages": messages,
+        "stream": False,
+        "keep_alive": ai_core.OLLAMA_KEEP_ALIVE,
+        "options": {"num_predict": 250},
+    })
+    fake_response.raise_for_status.assert_called_once()
+
+@pytest.mark.anyio
+async def test_stream_responses_yields_both_styles_and_caches_result(mock_ai_env_toggle, monkeypatch):
+    mock_ai_env_toggle(False)
+    monkeypatch.setattr(ai_core, "http_session", mock.Mock())
+    monkeypatch.setattr(ai_core, "response_cache", ai_core.LLMCache(maxsize=10, ttl=60))
+
+    async def _fake_stream(session, model_name, messages, options):
+        style_word = "formal" if "formal" in messages[0]["content"] else "casual"
+        for piece in (style_word, " reply"):
+            yield piece
+
+    monkeypatch.setattr(ai_core, "_ollama_chat_stream", _fake_stream)
+    pieces = [item async for item in ai_core.stream_responses("Streamed query")]
+    assert "".join(p for s, p in pieces if s == "casual") == "casual reply"
+    assert "".join(p for s, p in pieces if s == "formal") == "formal reply"
+    cached = await ai_core.response_cache.get(ai_core.cache_key(ai_core.OLLAMA_MODEL, ai_core.CASUAL_STYLE_DESCRIPTION, "Streamed query"))
+    assert cached == "casual reply"
+
+@pytest.mark.anyio
+async def test_query_ollama_model_sends_style_prompt():
+    fake_session = mock.Mock()
+    fake_session.post.return_value = _FakeAiohttpResponse({"message": {"content": "  Rephrased text.  "}})
+
+    result = await ai_core._query_ollama_model(fake_session, "test-model", "Some query", "casual")
+    assert result == "Rephrased text."
+    payload = fake_session.post.call_args.kwargs["json"]
+    assert payload["model"] == "test-model"
+    assert payload["messages"][1] == {"role": "user", "content": "Some query"}
+    assert payload["options"] == {"num_predict": 250, "temperature": 0.7}
+
+@pytest.mark.anyio
+async def test_query_ollama_model_serves_repeat_queries_from_cache(monkeypatch):
+    monkeypatch.setattr(ai_core, "response_cache", ai_core.LLMCache(maxsize=10, ttl=60))
+    ollama_chat = mock.AsyncMock(return_value="Cached reply")
+    monkeypatch.setattr(ai_core, "_ollama_chat", ollama_chat)
+    fake_session = mock.Mock()
+
+    first = await ai_core._query_ollama_model(fake_session, "test-model", "Repeat query", "casual")
+    second = await ai_core._query_ollama_model(fake_session, "test-model", "Repeat query", "casual")
+    assert first == second == "Cached reply"
+    assert ollama_chat.await_count == 1
+
+    # A different style is a different cache entry
+    await ai_core._query_ollama_model(fake_session, "test-model", "Repeat query", "formal")
+    assert ollama_chat.await_count == 2
+
+@pytest.mark.anyio
+async def test_query_ollama_model_does_not_cache_errors(monkeypatch):
+    monkeypatch.setattr(ai_core, "response_cache", ai_core.LLMCache(maxsize=10, ttl=60))
+    ollama_chat = mock.AsyncMock(side_effect=[Exception("Boom"), "Recovered reply"])
+    monkeypatch.setattr(ai_core, "_ollama_chat", ollama_chat)
+    fake_session = mock.Mock()
+
+    first = await ai_core._query_ollama_model(fake_session, "test-model", "Flaky query", "casual")
+    assert "error: an unexpected error occurred" in first.lower()
+    second = await ai_core._query_ollama_model(fake_session, "test-model", "Flaky query", "casual")
+    assert second == "Recovered reply"
+
+@pytest.mark.anyio
+async def test_query_ollama_dual_style_parses_both_segments(monkeypatch):
+    ollama_chat = mock.AsyncMock(return_value="[1] Hey, what's up?\n[2] Good day. How may I assist you?")
+    monkeypatch.setattr(ai_core, "_ollama_chat", ollama_chat)
+
+    result = await ai_core._query_ollama_dual_style(mock.Mock(), "test-model", "Hello")
+    assert result == ("Hey, what's up?", "Good day. How may I assist you?")
+    _, _, messages, options = ollama_chat.await_args.args
+    assert options["num_predict"] == 500
+    assert "[1] <casual version>" in messages[0]["content"]
+
+@pytest.mark.anyio
+async def test_query_ollama_dual_style_returns_none_on_unparseable_reply(monkeypatch):
+    monkeypatch.setattr(ai_core, "_ollama_chat", mock.AsyncMock(return_value="Just one rephrasing."))
+    assert await ai_core._query_ollama_dual_style(mock.Mock(), "test-model", "Hello") is None
+
+@pytest.mark.anyio
+async def test_generate_responses_uses_single_dual_style_call(mock_ai_env_toggle, monkeypatch):
+    mock_ai_env_toggle(False)
+    monkeypatch.setattr(ai_core, "USE_DUAL_STYLE_PROMPT", True)
+    monkeypatch.setattr(ai_core, "http_session", mock.Mock())
+    ollama_chat = mock.AsyncMock(return_value="[1] Casual take.\n[2] Formal take.")
+    monkeypatch.setattr(ai_core, "_ollama_chat", ollama_chat)
+
+    casual_resp, formal_resp = await ai_core.generate_responses("Dual query")
+    assert (casual_resp, formal_resp) == ("Casual take.", "Formal take.")
+    assert ollama_chat.await_count == 1
+
+@pytest.mark.anyio
+async def test_generate_responses_falls_back_to_per_style_calls(mock_ai_env_toggle, monkeypatch):
+    mock_ai_env_toggle(False)
+    monkeypatch.setattr(ai_core, "USE_DUAL_STYLE_PROMPT", True)
+    monkeypatch.setattr(ai_core, "http_session", mock.Mock())
+    ollama_chat = mock.AsyncMock(side_effect=["No markers here.", "Casual fallback.", "Formal fallback."])
+    monkeypatch.setattr(ai_core, "_ollama_chat", ollama_chat)
+
+    casual_resp, formal_resp = await ai_core.generate_responses("Fallback query")
+    assert ollama_chat.await_count == 3
+    assert {casual_resp, formal_resp} == {"Casual fallback.", "Formal fallback."}
+
+@pytest.mark.anyio
+async def test_prewarm_connections_loads_model_and_swallows_errors(mock_ai_env_toggle, monkeypatch):
+    mock_ai_env_toggle(False)
+    fake_session = mock.Mock()
+    fake_session.post.return_value = _FakeAiohttpResponse({})
+    fake_session.post.return_value.read = mock.AsyncMock(return_value=b"{}")
+    monkeypatch.setattr(ai_core, "http_session", fake_session)
+
+    await ai_core.prewarm_connections()
+    fake_session.post.assert_called_once_with(f"{ai_core.OLLAMA_BASE_URL}/api/chat", json={
+        "model": ai_core.OLLAMA_MODEL, "messages": [], "keep_alive": ai_core.OLLAMA_KEEP_ALIVE
+    })
+
+    fake_session.post.side_effect = ConnectionError("Ollama not up yet")
+    await ai_core.prewarm_connections() # Must not raise
+
+@pytest.mark.anyio
+async def test_batch_dispatcher_packs_concurrent_requests_into_one_call(monkeypatch):
+    sent_messages = []
+
+    async def _fake_ollama_chat(session, model_name, messages, options):
+        sent_messages.append(messages)
+        return "[1] First rephrased.\n[2] Second rephrased.\n[3] Third rephrased."
+
+    monkeypatch.setattr(ai_core, "_ollama_chat", _fake_ollama_chat)
+    dispatcher = ai_core.BatchedOllamaDispatcher(session=mock.Mock(), window_seconds=0.05, max_batch=16)
+    dispatcher.start()
+    try:
+        results = await asyncio.gather(
+            dispatcher.submit("test-model", "first", "casual"),
+            dispatcher.submit("test-model", "second", "casual"),
+            dispatcher.submit("test-model", "third", "casual"),
+        )
+    finally:
+        await dispatcher.stop()
+
+    assert results == ["First rephrased.", "Second rephrased.", "Third rephrased."]
+    assert len(sent_messages) == 1
+    assert sent_messages[0][1]["content"] == "[1] first\n[2] second\n[3] third"
+
+@pytest.mark.anyio
+async def test_batch_dispatcher_retries_missing_segments_individually(monkeypatch):
+    sent_messages = []
+
+    async def _fake_ollama_chat(session, model_name, messages, options):
+        sent_messages.append(messages)
+        if len(sent_messages) == 1:
+            return "[1] Only the first came back."
+        return "Second, on its own."
+
+    monkeypatch.setattr(ai_core, "_ollama_chat", _fake_ollama_chat)
+    dispatcher = ai_core.BatchedOllamaDispatcher(session=mock.Mock(), window_seconds=0.05, max_batch=16)
+    dispatcher.start()
+    try:
+        results = await asyncio.gather(
+            dispatcher.submit("test-model", "first", "formal"),
+            dispatcher.submit("test-model", "second", "formal"),
+        )
+    finally:
+        await dispatcher.stop()
+
+    assert results == ["Only the first came back.", "Second, on its own."]
+    assert len(sent_messages) == 2
+    assert sent_messages[1][1]["content"] == "second" # Plain single-style request
+
 # --- Fixture for setting up REAL AI Path Logic for generate_responses tests ---
 @pytest.fixture
-def generate_responses_real_path_logic_setup(mock_ai_env_toggle, mocker):
+def generate_responses_real_path_logic_setup(mock_ai_env_toggle, monkeypatch):
     """
     Sets USE_MOCK_AI=False and mocks dependencies for generate_responses.
     Yields the mock for _query_hf_model_real.
     """
     mock_ai_env_toggle(False)
-    # Mock os.getenv to control HF_API_TOKEN value during the test
+    # Control HF_API_TOKEN through the environment (os.getenv itself stays real)
     # Default to a valid token for general structure tests
-    mocker.patch.object(os, 'getenv', return_value="test_token_123_xyz")
+    monkeypatch.setenv("HF_API_TOKEN", "test_token_123_xyz")
     # Ensuring ai_core.load_dotenv is a callable mock, simulating successful import
-    mocker.patch.object(ai_core, 'load_dotenv', mocker.MagicMock())
+    monkeypatch.setattr(ai_core, 'load_dotenv', mock.Mock())
     
-    mocked_core_real_call = mocker.patch('app.ai_core._query_hf_model_real')
+    # A plain Mock is enough here and much cheaper to build than mocker.patch's MagicMock
+    mocked_core_real_call = mock.Mock()
+    monkeypatch.setattr(ai_core, '_query_hf_model_real', mocked_core_real_call)
     return mocked_core_real_call
 
-def test_generate_responses_real_path_structure(generate_responses_real_path_logic_setup):
+@pytest.mark.anyio
+async def test_generate_responses_real_path_structure(generate_responses_real_path_logic_setup):
     mocked_real_api_call = generate_responses_real_path_logic_setup
-    mocked_real_api_call.side_effect = [
-        [{"generated_text": "Real casual response."}],
-        [{"generated_text": "Real detailed formal text."}],
-        [{"generated_text": "Real summarized formal text."}]
-    ]
+    # Casual and formal generation may run concurrently, so answer by prompt rather than call order
+    replies_by_prompt = {
+        "casual, friendly": "Real casual response.",
+        "comprehensive, formal": "Real detailed formal text.",
+        "summarize the following formal text": "Real summarized formal text.",
+    }
+    def _reply(*args, **kwargs):
+        inputs = args[2]['inputs'].lower()
+        return [{"generated_text": next(text for tag, text in replies_by_prompt.items() if tag in inputs)}]
+    mocked_real_api_call.side_effect = _reply
     query = "Test query for real path"
-    casual_resp, formal_resp = ai_core.generate_responses(query)
+    casual_resp, formal_resp = await ai_core.generate_responses(query)
     assert mocked_real_api_call.call_count == 3
-    # ... (detailed assertions for call_args_list as before)
-    casual_call_args = mocked_real_api_call.call_args_list[0].args
-    assert "casual, friendly" in casual_call_args[2]['inputs'].lower()
-    formal_generate_call_args = mocked_real_api_call.call_args_list[1].args
-    assert "comprehensive, formal" in formal_generate_call_args[2]['inputs'].lower()
-    formal_summarize_call_args = mocked_real_api_call.call_args_list[2].args
-    assert "summarize the following formal text" in formal_summarize_call_args[2]['inputs'].lower()
+    sent_inputs = [c.args[2]['inputs'].lower() for c in mocked_real_api_call.call_args_list]
+    for tag in replies_by_prompt:
+        assert sum(tag in inputs for inputs in sent_inputs) == 1
     assert casual_resp == "Real casual response."
     assert formal_resp == "Real summarized formal text."
 
 
-def test_generate_responses_real_path_no_hf_token(mock_ai_env_toggle, mocker):
+@pytest.mark.anyio
+async def test_generate_responses_real_path_no_hf_token(mock_ai_env_toggle, mocker, monkeypatch):
     mock_ai_env_toggle(False)
-    mocker.patch.object(os, 'getenv', return_value=None) # Simulating missing token
+    monkeypatch.delenv("HF_API_TOKEN", raising=False) # Simulating missing token
     mocker.patch.object(ai_core, 'load_dotenv', mocker.MagicMock()) # Ensuring load_dotenv is callable
 
-    casual_resp, formal_resp = ai_core.generate_responses("A query")
+    casual_resp, formal_resp = await ai_core.generate_responses("A query")
     assert "error: huggingface_api_token not configured" in casual_resp.lower()
     assert "error: huggingface_api_token not configured" in formal_resp.lower()
 
-def test_generate_responses_real_path_missing_dotenv_module(mock_ai_env_toggle, mocker):
+@pytest.mark.anyio
+async def test_generate_responses_real_path_missing_dotenv_module(mock_ai_env_toggle, mocker, monkeypatch):
     mock_ai_env_toggle(False)
-    mocker.patch.object(os, 'getenv', return_value="fake_token_for_this_test")
+    monkeypatch.setenv("HF_API_TOKEN", "fake_token_for_this_test")
     mocker.patch.object(ai_core, 'load_dotenv', None) # Simulating load_dotenv was not imported
     
-    casual_resp, formal_resp = ai_core.generate_responses("A query")
+    casual_resp, formal_resp = await ai_core.generate_responses("A query")
     assert "error: missing dotenv for api config" in casual_resp.lower()
     assert "error: missing dotenv for api config" in formal_resp.lower()
 
 # --- Fixture for testing _query_hf_model_real internals ---
+# Stand-ins for requests' exception types, built once at import rather than per test
+# Defining a basic TimeoutException for testing
+TimeoutFromMock = type('TimeoutFromMock', (IOError,), {})
+
+# Defining a RequestException that can take a 'response' kwarg
+def _init_request_exception(self, message="Mock Request Exception", response=None):
+    super(type(self), self).__init__(message)
+    self.response = response
+    self.message = message # Storing message for str(e)
+
+RequestExceptionFromMock = type(
+    'RequestExceptionFromMock', (Exception,), {'__init__': _init_request_exception}
+)
+
+# Shared, read-only 'requests.exceptions' stand-in. Only the per-test parts (post) live on a fresh
+# mock: copy.copy of a MagicMock template would share its child mocks, leaking side_effects across tests.
+_REQUESTS_EXCEPTIONS = types.SimpleNamespace(Timeout=TimeoutFromMock, RequestException=RequestExceptionFromMock)
+
 @pytest.fixture
-def mock_aicore_requests_module_for_query_real(mocker, mock_ai_env_toggle):
+def mock_aicore_requests_module_for_query_real(monkeypatch, mock_ai_env_toggle):
     mock_ai_env_toggle(False)
-    mocked_requests = mocker.patch('app.ai_core.requests')
-    
-    mocked_requests.exceptions = mock.MagicMock()
-    # Defining a basic TimeoutException for testing
-    mocked_requests.exceptions.Timeout = type('TimeoutFromMock', (IOError,), {})
-
-    # Defining a RequestException that can take a 'response' kwarg
-    def init_request_exception(self, message="Mock Request Exception", response=None):
-        super(type(self), self).__init__(message)
-        self.response = response
-        self.message = message # Storing message for str(e)
-
-    RequestExceptionFromMock = type(
-        'RequestExceptionFromMock', (Exception,), {'__init__': init_request_exception}
-    )
-    mocked_requests.exceptions.RequestException = RequestExceptionFromMock
+    mocked_requests = mock.Mock(exceptions=_REQUESTS_EXCEPTIONS)
+    monkeypatch.setattr(ai_core, 'requests', mocked_requests)
     return mocked_requests
 
 def test_query_hf_model_real_success(mock_aicore_requests_module_for_query_real):
@@ -1,57 +1,94 @@
 import pytest
-from fastapi.testclient import TestClient
+import httpx
 from fastapi import status
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from typing import AsyncGenerator, Optional
+from datetime import datetime, timedelta, timezone
+import contextlib
 import uuid
 
 
-from app.main import app, get_db_session 
-from app.database import Base, DATABASE_URL , engine as main_engine
+from app.main import app, get_db_session, get_db_session_factory 
+from app.database import Base, DATABASE_URL , PromptInteraction, engine as main_engine
 from app import schemas, crud 
 from app import ai_core 
 
-# --- Test Database Setup ---
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=main_engine)
-
-# Creating tables for the test session if they don't exist (idempotent)
-Base.metadata.create_all(bind=main_engine)
+pytestmark = pytest.mark.anyio
 
 # --- Fixtures ---
 
+@pytest.fixture(scope="session", autouse=True)
+async def create_test_tables():
+    """
+    Creates tables for the test session if they don't exist (idempotent).
+    Runs in a fixture rather than at import: under pytest-xdist every worker imports this module,
+    but with --dist=loadfile only the worker that runs these tests touches the database.
+    """
+    async with main_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    await main_engine.dispose()
+
+
+@pytest.fixture(scope="session")
+async def _shared_connection(create_test_tables) -> AsyncGenerator[AsyncConnection, None]:
+    """
+    One connection and outer transaction for the whole test session; never committed.
+    """
+    async with main_engine.connect() as connection:
+        outer_transaction = await connection.begin()
+        yield connection
+        await outer_transaction.rollback()
+
+
 @pytest.fixture(scope="function")
-def db_session_for_tests() -> Generator[Session, None, None]:
+async def db_session_for_tests(_shared_connection: AsyncConnection) -> AsyncGenerator[AsyncSession, None]:
     """
     Provides a transactional database session for tests.
-    Rolls back any changes after the test.
+    Each test runs inside a SAVEPOINT on the shared connection, rolled back afterwards;
+    the session's own commits only release inner SAVEPOINTs (join_transaction_mode="create_savepoint").
     """
-    connection = main_engine.connect()
-    transaction = connection.begin()
-    db = TestingSessionLocal(bind=connection)
+    test_savepoint = await _shared_connection.begin_nested()
+    db = AsyncSession(
+        bind=_shared_connection, autoflush=False, expire_on_commit=False,
+        join_transaction_mode="create_savepoint"
+    )
 
     yield db
 
-    db.close()
-    transaction.rollback()
-    connection.close()
+    await db.close()
+    await test_savepoint.rollback()
+
+
+@pytest.fixture(scope="session")
+async def _test_client() -> AsyncGenerator[httpx.AsyncClient, None]:
+    """
+    Provides one async HTTP client bound to the app for the whole test session.
+    """
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as c:
+        yield c
 
 
 @pytest.fixture(scope="function")
-def client(db_session_for_tests: Session) -> Generator[TestClient, None, None]:
+async def client(_test_client: httpx.AsyncClient, db_session_for_tests: AsyncSession) -> AsyncGenerator[httpx.AsyncClient, None]:
     """
-    Provides a TestClient instance with the database dependency overridden.
+    Provides the shared HTTP client with the database dependency overridden for this test.
     """
-    def override_get_db():
+    async def override_get_db():
         try:
             yield db_session_for_tests
         finally:
             pass 
 
     app.dependency_overrides[get_db_session] = override_get_db
-    with TestClient(app) as c:
-        yield c
-    del app.dependency_overrides[get_db_session] 
+    # Background-task writes reuse the test session; nullcontext keeps it open for the test's asserts
+    app.dependency_overrides[get_db_session_factory] = lambda: (lambda: contextlib.nullcontext(db_session_for_tests))
+    try:
+        yield _test_client
+    finally:
+        app.dependency_overrides.pop(get_db_session, None)
+        app.dependency_overrides.pop(get_db_session_factory, None)
 
 
 @pytest.fixture
@@ -60,32 +97,51 @@ def mock_aicore_generate(mocker):
     return mocker.patch('app.ai_core.generate_responses')
 
 # --- Helper to create interaction for tests ---
-def create_test_interaction(db: Session, user_id: str, query: str = "Test query",
-                            casual: str = "Casual test.", formal: str = "Formal test."):
+async def create_test_interaction(db: AsyncSession, user_id: str, query: str = "Test query",
+                            casual: str = "Casual test.", formal: str = "Formal test.",
+                            created_at: Optional[datetime] = None):
     interaction_data = schemas.InteractionCreateInternal(
         user_id=user_id,
         query=query,
         casual_response=casual,
-        formal_response=formal
+        formal_response=formal,
+        created_at=created_at
     )
-    return crud.create_interaction(db=db, interaction=interaction_data)
+    return await crud.create_interaction(db=db, interaction=interaction_data)
+
+async def _bulk_create_interactions(db: AsyncSession, user_id: str, n: int, base_time: datetime) -> list[uuid.UUID]:
+    """
+    Inserts n interactions with one executemany INSERT, created one second apart (oldest first).
+    Returns their IDs in insertion order.
+    """
+    rows = [
+        {
+            "id": uuid.uuid4(), "user_id": user_id, "query": f"Page query {i}",
+            "casual_response": "Casual test.", "formal_response": "Formal test.",
+            "created_at": base_time + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+    await db.execute(insert(PromptInteraction), rows)
+    await db.commit()
+    return [row["id"] for row in rows]
 
 # --- Test Cases ---
 
-def test_read_root(client: TestClient):
-    response = client.get("/")
+async def test_read_root(client: httpx.AsyncClient):
+    response = await client.get("/")
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {"message": "Welcome to StyleCraft AI Backend!"}
 
 # --- /generate/ Endpoint Tests ---
 
-def test_handle_generate_request_success(client: TestClient, db_session_for_tests: Session, mock_aicore_generate):
+async def test_handle_generate_request_success(client: httpx.AsyncClient, db_session_for_tests: AsyncSession, mock_aicore_generate):
     mock_aicore_generate.return_value = ("Mocked Casual", "Mocked Formal")
     user_id = "testuser123"
     query = "Explain FastAPI testing."
-    request_data = {"user_id": user_id, "query": query}
+    request_data = {"query": query}
 
-    response = client.post("/generate/", json=request_data)
+    response = await client.post("/generate/", json=request_data, headers={"X-User-Id": user_id})
 
     assert response.status_code == status.HTTP_201_CREATED
     data = response.json()
@@ -99,45 +155,70 @@ def test_handle_generate_request_success(client: TestClient, db_session_for_test
     mock_aicore_generate.assert_called_once_with(query)
 
     # Verify in DB
-    db_interaction = crud.get_interaction(db_session_for_tests, interaction_id=uuid.UUID(data["id"]))
+    db_interaction = await crud.get_interaction(db_session_for_tests, interaction_id=uuid.UUID(data["id"]))
     assert db_interaction is not None
     assert db_interaction.user_id == user_id
     assert db_interaction.query == query
 
 
-def test_handle_generate_request_aicore_failure_returns_none(client: TestClient, mock_aicore_generate):
+async def test_handle_generate_request_aicore_failure_returns_none(client: httpx.AsyncClient, mock_aicore_generate):
     mock_aicore_generate.return_value = (None, None) # Simulating AI core returning no content
-    request_data = {"user_id": "testuser", "query": "A query that fails AI."}
-    response = client.post("/generate/", json=request_data)
+    request_data = {"query": "A query that fails AI."}
+    response = await client.post("/generate/", json=request_data, headers={"X-User-Id": "testuser"})
     assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
     assert "AI response generation failed" in response.json()["detail"]
 
-def test_handle_generate_request_aicore_exception(client: TestClient, mock_aicore_generate):
+async def test_handle_generate_request_aicore_exception(client: httpx.AsyncClient, mock_aicore_generate):
     mock_aicore_generate.side_effect = Exception("Simulated AI Core Explosion")
-    request_data = {"user_id": "testuser", "query": "A query that breaks AI."}
-    response = client.post("/generate/", json=request_data)
+    request_data = {"query": "A query that breaks AI."}
+    response = await client.post("/generate/", json=request_data, headers={"X-User-Id": "testuser"})
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
     assert "AI generation error: Simulated AI Core Explosion" in response.json()["detail"]
 
 
-def test_handle_generate_request_validation_error(client: TestClient):
-    response = client.post("/generate/", json={"user_id": "testuser"}) # Missing query
+async def test_handle_generate_stream_request_sends_events_and_saves(client: httpx.AsyncClient, db_session_for_tests: AsyncSession, mocker):
+    async def _fake_stream(query):
+        for item in (("casual", "Hey "), ("formal", "Greetings."), ("casual", "there!")):
+            yield item
+
+    mocker.patch('app.ai_core.stream_responses', _fake_stream)
+    response = await client.post("/generate/stream", json={"query": "Stream it"}, headers={"X-User-Id": "streamer"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'event: casual\ndata: {"text": "Hey "}' in response.text
+    assert "event: done" in response.text
+
+    saved = await crud.get_interactions_by_user(db_session_for_tests, user_id="streamer")
+    assert len(saved) == 1
+    saved_interaction = await crud.get_interaction(db_session_for_tests, interaction_id=saved[0].id)
+    assert saved_interaction.casual_response == "Hey there!"
+    assert saved_interaction.formal_response == "Greetings."
+
+
+async def test_handle_generate_request_validation_error(client: httpx.AsyncClient):
+    response = await client.post("/generate/", json={}, headers={"X-User-Id": "testuser"}) # Missing query
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+async def test_handle_generate_request_missing_user_header(client: httpx.AsyncClient, mock_aicore_generate):
+    response = await client.post("/generate/", json={"query": "Who am I?"}) # Missing X-User-Id
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    mock_aicore_generate.assert_not_called()
 
 # --- /interactions/ Endpoint Tests (GET all, GET by user, GET by ID) ---
 
-def test_read_all_interactions_empty(client: TestClient):
-    response = client.get("/interactions/")
+async def test_read_all_interactions_empty(client: httpx.AsyncClient):
+    response = await client.get("/interactions/")
     assert response.status_code == status.HTTP_200_OK
-    assert response.json() == []
+    assert response.json() == {"items": [], "next_cursor": None}
 
-def test_read_all_interactions_with_data(client: TestClient, db_session_for_tests: Session):
-    interaction1 = create_test_interaction(db_session_for_tests, user_id="user1")
-    interaction2 = create_test_interaction(db_session_for_tests, user_id="user2", query="Query 2")
+async def test_read_all_interactions_with_data(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    interaction1 = await create_test_interaction(db_session_for_tests, user_id="user1")
+    interaction2 = await create_test_interaction(db_session_for_tests, user_id="user2", query="Query 2")
 
-    response = client.get("/interactions/?limit=5") # Adding limit to get all
+    response = await client.get("/interactions/?limit=5") # Adding limit to get all
     assert response.status_code == status.HTTP_200_OK
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) == 2
     
     returned_ids = [item["id"] for item in data]
@@ -145,15 +226,29 @@ def test_read_all_interactions_with_data(client: TestClient, db_session_for_test
     assert str(interaction2.id) in returned_ids
 
 
-def test_read_interactions_for_user_found(client: TestClient, db_session_for_tests: Session):
+async def test_read_all_interactions_returns_truncated_previews(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    long_casual = "c" * (crud.LIST_PREVIEW_CHARS + 50)
+    interaction = await create_test_interaction(db_session_for_tests, user_id="preview_user", casual=long_casual, formal="Short formal.")
+
+    item = (await client.get("/interactions/")).json()["items"][0]
+    assert item["casual_preview"] == long_casual[:crud.LIST_PREVIEW_CHARS]
+    assert item["formal_preview"] == "Short formal."
+    assert "casual_response" not in item
+
+    # The single-interaction endpoint still serves the full text
+    full = (await client.get(f"/interactions/{interaction.id}")).json()
+    assert full["casual_response"] == long_casual
+
+
+async def test_read_interactions_for_user_found(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
     user_id = "specific_user"
-    create_test_interaction(db_session_for_tests, user_id="other_user") # decoy
-    interaction1 = create_test_interaction(db_session_for_tests, user_id=user_id, query="User query 1")
-    interaction2 = create_test_interaction(db_session_for_tests, user_id=user_id, query="User query 2")
+    await create_test_interaction(db_session_for_tests, user_id="other_user") # decoy
+    interaction1 = await create_test_interaction(db_session_for_tests, user_id=user_id, query="User query 1")
+    interaction2 = await create_test_interaction(db_session_for_tests, user_id=user_id, query="User query 2")
 
-    response = client.get(f"/interactions/user/{user_id}")
+    response = await client.get(f"/interactions/user/{user_id}")
     assert response.status_code == status.HTTP_200_OK
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) == 2
     for item in data:
         assert item["user_id"] == user_id
@@ -162,31 +257,31 @@ def test_read_interactions_for_user_found(client: TestClient, db_session_for_tes
     assert str(interaction2.id) in returned_ids
 
 
-def test_read_interactions_for_user_not_found_returns_empty_list(client: TestClient):
-    response = client.get("/interactions/user/nonexistent_user")
+async def test_read_interactions_for_user_not_found_returns_empty_list(client: httpx.AsyncClient):
+    response = await client.get("/interactions/user/nonexistent_user")
     assert response.status_code == status.HTTP_200_OK
-    assert response.json() == [] 
+    assert response.json() == {"items": [], "next_cursor": None}
 
-def test_read_single_interaction_found(client: TestClient, db_session_for_tests: Session):
-    interaction = create_test_interaction(db_session_for_tests, user_id="user_for_single_get")
-    response = client.get(f"/interactions/{interaction.id}")
+async def test_read_single_interaction_found(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    interaction = await create_test_interaction(db_session_for_tests, user_id="user_for_single_get")
+    response = await client.get(f"/interactions/{interaction.id}")
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert data["id"] == str(interaction.id)
     assert data["user_id"] == "user_for_single_get"
 
-def test_read_single_interaction_not_found(client: TestClient):
+async def test_read_single_interaction_not_found(client: httpx.AsyncClient):
     non_existent_id = uuid.uuid4()
-    response = client.get(f"/interactions/{non_existent_id}")
+    response = await client.get(f"/interactions/{non_existent_id}")
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
 # --- /interactions/{interaction_id} (PUT and DELETE) ---
 
-def test_update_existing_interaction_success(client: TestClient, db_session_for_tests: Session):
-    interaction = create_test_interaction(db_session_for_tests, user_id="user_to_update", query="Old query")
+async def test_update_existing_interaction_success(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    interaction = await create_test_interaction(db_session_for_tests, user_id="user_to_update", query="Old query")
     update_data = {"query": "Updated query text", "formal_response": "Updated formal response"}
 
-    response = client.put(f"/interactions/{interaction.id}", json=update_data)
+    response = await client.put(f"/interactions/{interaction.id}", json=update_data)
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert data["id"] == str(interaction.id)
@@ -195,81 +290,103 @@ def test_update_existing_interaction_success(client: TestClient, db_session_for_
     assert data["casual_response"] == interaction.casual_response 
 
     # Verify in DB
-    db_session_for_tests.refresh(interaction) 
+    await db_session_for_tests.refresh(interaction) 
     assert interaction.query == "Updated query text"
     assert interaction.formal_response == "Updated formal response"
 
-def test_update_existing_interaction_partial_success(client: TestClient, db_session_for_tests: Session):
-    interaction = create_test_interaction(db_session_for_tests, user_id="user_partial_update", query="Original Q", casual="Original C")
+async def test_update_existing_interaction_partial_success(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    interaction = await create_test_interaction(db_session_for_tests, user_id="user_partial_update", query="Original Q", casual="Original C")
     update_data = {"query": "Partially Updated Query"} 
 
-    response = client.put(f"/interactions/{interaction.id}", json=update_data)
+    response = await client.put(f"/interactions/{interaction.id}", json=update_data)
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert data["query"] == "Partially Updated Query"
     assert data["casual_response"] == "Original C" 
 
-    db_session_for_tests.refresh(interaction)
+    await db_session_for_tests.refresh(interaction)
     assert interaction.query == "Partially Updated Query"
     assert interaction.casual_response == "Original C"
 
-def test_update_existing_interaction_not_found(client: TestClient):
+async def test_update_existing_interaction_empty_body_returns_unchanged(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    interaction = await create_test_interaction(db_session_for_tests, user_id="user_empty_update", query="Keep me")
+    response = await client.put(f"/interactions/{interaction.id}", json={})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["query"] == "Keep me"
+
+async def test_update_existing_interaction_not_found(client: httpx.AsyncClient):
     non_existent_id = uuid.uuid4()
     update_data = {"query": "Attempt to update non-existent"}
-    response = client.put(f"/interactions/{non_existent_id}", json=update_data)
+    response = await client.put(f"/interactions/{non_existent_id}", json=update_data)
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
-def test_delete_existing_interaction_success(client: TestClient, db_session_for_tests: Session):
-    interaction = create_test_interaction(db_session_for_tests, user_id="user_to_delete")
+async def test_delete_existing_interaction_success(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    interaction = await create_test_interaction(db_session_for_tests, user_id="user_to_delete")
     interaction_id = interaction.id
 
-    response = client.delete(f"/interactions/{interaction_id}")
+    response = await client.delete(f"/interactions/{interaction_id}")
     assert response.status_code == status.HTTP_204_NO_CONTENT
 
     # Verify in DB
-    deleted_interaction = crud.get_interaction(db_session_for_tests, interaction_id=interaction_id)
+    deleted_interaction = await crud.get_interaction(db_session_for_tests, interaction_id=interaction_id)
     assert deleted_interaction is None
 
-def test_delete_existing_interaction_not_found(client: TestClient):
+async def test_delete_existing_interaction_not_found(client: httpx.AsyncClient):
     non_existent_id = uuid.uuid4()
-    response = client.delete(f"/interactions/{non_existent_id}")
+    response = await client.delete(f"/interactions/{non_existent_id}")
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
 # --- Pagination tests for /interactions/ ---
-def test_read_all_interactions_pagination(client: TestClient, db_session_for_tests: Session):
+async def test_read_all_interactions_pagination(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
     user_id = "pagination_user"
-    # Creating several interactions
-    all_ids = []
-    for i in range(15): # Creating 15 interactions
-        interaction = create_test_interaction(db_session_for_tests, user_id=user_id, query=f"Page query {i}")
-        all_ids.append(str(interaction.id))
-    db_session_for_tests.commit() # Commiting to ensure they are queryable in order for this test
+    # Creating 15 interactions in one INSERT, one second apart so newest-first order is known
+    all_ids = await _bulk_create_interactions(db_session_for_tests, user_id, 15, base_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    newest_first_ids = [str(interaction_id) for interaction_id in reversed(all_ids)]
 
     # Test limit
-    response_limit_5 = client.get("/interactions/?limit=5")
+    response_limit_5 = await client.get("/interactions/?limit=5")
     assert response_limit_5.status_code == status.HTTP_200_OK
-    data_limit_5 = response_limit_5.json()
-    assert len(data_limit_5) == 5
-
-    # Test skip and limit
-    response_skip_5_limit_5 = client.get("/interactions/?skip=5&limit=5")
-    assert response_skip_5_limit_5.status_code == status.HTTP_200_OK
-    data_skip_5_limit_5 = response_skip_5_limit_5.json()
-    assert len(data_skip_5_limit_5) == 5
-
-    # Ensuring items are different between pages
-    ids_page1 = {item["id"] for item in data_limit_5}
-    ids_page2 = {item["id"] for item in data_skip_5_limit_5}
-    assert len(ids_page1.intersection(ids_page2)) == 0
+    page1 = response_limit_5.json()
+    assert [item["id"] for item in page1["items"]] == newest_first_ids[:5]
+    assert page1["next_cursor"] is not None
+
+    # Test following the cursor
+    response_page2 = await client.get("/interactions/", params={"limit": 5, "cursor": page1["next_cursor"]})
+    assert response_page2.status_code == status.HTTP_200_OK
+    page2 = response_page2.json()
+    assert [item["id"] for item in page2["items"]] == newest_first_ids[5:10]
+
+    # Last page has no further cursor
+    response_page3 = await client.get("/interactions/", params={"limit": 5, "cursor": page2["next_cursor"]})
+    page3 = response_page3.json()
+    assert [item["id"] for item in page3["items"]] == newest_first_ids[10:]
+    assert page3["next_cursor"] is None
 
     # Test retrieving all (or up to default/max limit if not all 15 are fetched by default)
-    response_all_default_limit = client.get("/interactions/") 
+    response_all_default_limit = await client.get("/interactions/") 
     assert response_all_default_limit.status_code == status.HTTP_200_OK
-    data_all_default_limit = response_all_default_limit.json()
-    assert len(data_all_default_limit) == 10 
+    assert len(response_all_default_limit.json()["items"]) == 10 
 
     # Test retrieving more than default limit
-    response_limit_15 = client.get("/interactions/?limit=15")
+    response_limit_15 = await client.get("/interactions/?limit=15")
     assert response_limit_15.status_code == status.HTTP_200_OK
     data_limit_15 = response_limit_15.json()
-    assert len(data_limit_15) == 15 
+    assert len(data_limit_15["items"]) == 15
+    assert data_limit_15["next_cursor"] is None
+
+async def test_read_interactions_for_user_pagination_follows_cursor(client: httpx.AsyncClient, db_session_for_tests: AsyncSession):
+    base_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(3):
+        await create_test_interaction(db_session_for_tests, user_id="paged_user", query=f"Q{i}", created_at=base_time + timedelta(seconds=i))
+    await create_test_interaction(db_session_for_tests, user_id="other_user", created_at=base_time) # decoy
+
+    page1 = (await client.get("/interactions/user/paged_user?limit=2")).json()
+    page2 = (await client.get("/interactions/user/paged_user", params={"limit": 2, "cursor": page1["next_cursor"]})).json()
+    assert [item["query"] for item in page1["items"]] == ["Q2", "Q1"]
+    assert [item["query"] for item in page2["items"]] == ["Q0"]
+    assert page2["next_cursor"] is None
+
+async def test_read_all_interactions_invalid_cursor(client: httpx.AsyncClient):
+    response = await client.get("/interactions/?cursor=not-a-cursor")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Invalid pagination cursor" in response.json()["detail"]
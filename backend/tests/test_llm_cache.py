@@ -0,0 +1,51 @@
+import pytest
+from unittest import mock
+
+from app import llm_cache
+from app.llm_cache import LLMCache, cache_key
+
+
+def test_cache_key_is_deterministic_and_style_sensitive():
+    key = cache_key("model-a", "casual", "Hello there")
+    assert key == cache_key("model-a", "casual", "Hello there")
+    assert key != cache_key("model-a", "formal", "Hello there")
+    assert key != cache_key("model-b", "casual", "Hello there")
+    assert len(key) == 64 # sha256 hex digest
+
+@pytest.mark.anyio
+async def test_cache_get_set_roundtrip():
+    cache = LLMCache(maxsize=10, ttl=60)
+    assert await cache.get("missing") is None
+    await cache.set("some-key", "Some response")
+    assert await cache.get("some-key") == "Some response"
+
+@pytest.mark.anyio
+async def test_cache_evicts_least_recently_used():
+    cache = LLMCache(maxsize=2, ttl=60)
+    await cache.set("a", "A")
+    await cache.set("b", "B")
+    await cache.get("a") # 'b' is now the least recently used entry
+    await cache.set("c", "C")
+    assert await cache.get("a") == "A"
+    assert await cache.get("b") is None
+    assert await cache.get("c") == "C"
+
+@pytest.mark.anyio
+async def test_cache_promotes_redis_hits_and_ignores_redis_errors(monkeypatch):
+    fake_redis = mock.Mock()
+    fake_redis.get = mock.AsyncMock(return_value="From Redis")
+    fake_redis.set = mock.AsyncMock(side_effect=ConnectionError("Redis down"))
+    monkeypatch.setattr(llm_cache, "REDIS_AVAILABLE", True)
+    monkeypatch.setattr(llm_cache, "redis_asyncio", mock.Mock(from_url=mock.Mock(return_value=fake_redis)))
+
+    cache = LLMCache(maxsize=10, ttl=60, redis_url="redis://example:6379/0")
+    assert await cache.get("shared-key") == "From Redis"
+    assert await cache.get("shared-key") == "From Redis"
+    fake_redis.get.assert_awaited_once() # Second lookup served from the local tier
+
+    await cache.set("other-key", "Local only") # Redis failure must not raise
+    assert await cache.get("other-key") == "Local only"
+
+def test_from_env_returns_none_when_disabled(monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", False)
+    assert LLMCache.from_env() is None
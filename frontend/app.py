@@ -1,5 +1,7 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from dotenv import load_dotenv
 from datetime import datetime
@@ -9,6 +11,25 @@ load_dotenv()
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 GENERATE_ENDPOINT = f"{API_BASE_URL}/generate/"
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", "120")) # Generation can take a while on a cold model
+HISTORY_MAX_ITEMS = 50 # Older interactions are dropped from the session
+HISTORY_VISIBLE_ITEMS = 10 # Rendered in the sidebar by default; the rest sit behind "Show older"
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Returns one pooled HTTP session shared across Streamlit reruns (a plain module-level
+    Session would be rebuilt on every rerun), so the connection to the API stays warm.
+    """
+    session = requests.Session()
+    # Retry gateway errors (proxy in front of a backend that is still starting); not 503, which means
+    # the AI call itself failed. After the last retry the response is returned as-is.
+    retries = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 504),
+                    allowed_methods=frozenset({"POST"}), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 # --- Initialize session state ---
 if 'user_id' not in st.session_state:
@@ -35,6 +56,21 @@ def add_to_history(query, casual_response, formal_response):
         "formal": formal_response,
         "timestamp": timestamp
     })
+    del st.session_state.history[HISTORY_MAX_ITEMS:]
+
+def show_history_item(item):
+    st.session_state.current_casual_response = item['casual']
+    st.session_state.current_formal_response = item['formal']
+
+def render_history_item(i, item):
+    with st.sidebar.expander(f"{item['timestamp']} - Query: {item['query'][:30]}..."):
+        st.markdown(f"**Query:**\n```\n{item['query']}\n```")
+        st.markdown(f"**Casual Response:**\n```\n{item['casual']}\n```")
+        st.markdown(f"**Formal Response:**\n```\n{item['formal']}\n```")
+        # on_click runs before the rerun the click triggers, so the response columns above
+        # already show the selected item without a second st.rerun() pass
+        st.button(f"Re-view #{len(st.session_state.history)-i}", key=f"review_btn_{i}",
+                  on_click=show_history_item, args=(item,))
 
 # --- UI Sections ---
 st.sidebar.header("User Settings")
@@ -73,14 +109,12 @@ if submit_button:
     else:
         with st.spinner("🤖 Generating AI responses... Please wait."):
             try:
-                payload = {
-                    "query": user_query,
-                    "user_id": st.session_state.user_id
-                }
+                payload = {"query": user_query}
+                headers = {"X-User-Id": st.session_state.user_id}
                 
                 print(f"DEBUG: Sending POST to: {GENERATE_ENDPOINT}") 
-                print(f"DEBUG: Payload: {payload}") 
-                response = requests.post(GENERATE_ENDPOINT, json=payload)
+                print(f"DEBUG: Payload: {payload}, Headers: {headers}") 
+                response = get_http_session().post(GENERATE_ENDPOINT, json=payload, headers=headers, timeout=API_TIMEOUT_SECONDS)
 
                 if response.status_code == 201:
                     data = response.json()
@@ -93,12 +127,12 @@ if submit_button:
                     )
                     
                 else:
-                    try:
-                        error_data = response.json()
-                        detail = error_data.get("detail", "Unknown error from API.")
-                        st.session_state.error_message = f"API Error ({response.status_code}): {detail}"
-                    except requests.exceptions.JSONDecodeError:
-                        st.session_state.error_message = f"API Error ({response.status_code}): {response.text}"
+                    # Only FastAPI's own errors are JSON; proxy/server error pages are shown as raw text
+                    if response.headers.get("content-type", "").startswith("application/json"):
+                        detail = response.json().get("detail", "Unknown error from API.")
+                    else:
+                        detail = response.text
+                    st.session_state.error_message = f"API Error ({response.status_code}): {detail}"
 
             except requests.exceptions.RequestException as e:
                 st.session_state.error_message = f"Connection Error: Could not reach API. ({e})"
@@ -134,16 +168,11 @@ st.sidebar.header("📜 Interaction History")
 if not st.session_state.history:
     st.sidebar.caption("No interactions yet.")
 else:
-    for i, item in enumerate(st.session_state.history):
-        with st.sidebar.expander(f"{item['timestamp']} - Query: {item['query'][:30]}..."):
-            st.markdown(f"**Query:**\n```\n{item['query']}\n```")
-            st.markdown(f"**Casual Response:**\n```\n{item['casual']}\n```")
-            st.markdown(f"**Formal Response:**\n```\n{item['formal']}\n```")
-            if st.button(f"Re-view #{len(st.session_state.history)-i}", key=f"review_btn_{i}"):
-                st.session_state.current_casual_response = item['casual']
-                st.session_state.current_formal_response = item['formal']
-                
-                st.experimental_rerun() 
+    for i, item in enumerate(st.session_state.history[:HISTORY_VISIBLE_ITEMS]):
+        render_history_item(i, item)
+    if len(st.session_state.history) > HISTORY_VISIBLE_ITEMS and st.sidebar.checkbox("Show older"):
+        for i, item in enumerate(st.session_state.history[HISTORY_VISIBLE_ITEMS:], start=HISTORY_VISIBLE_ITEMS):
+            render_history_item(i, item)
 
 
 st.markdown("---")